@@ -17,7 +17,12 @@ def get_fumble(skill_val):
 
 class Die(object):
 
-    def __init__(self, skill_val=42):
+    def __init__(self, skill_val=42, rng=random):
+        """
+        :param rng - anything with randint(a, b), defaults to the random module.
+                     Pass a seeded generator to make rolls reproducible.
+        """
+        self.rng = rng
         self.fumble = get_fumble(skill_val)
         self.skill_val = skill_val
         self.hard_suc = skill_val // 2
@@ -30,12 +35,12 @@ class Die(object):
 
         if modifier != 0:
 
-            ones_digit = random.randint(0, 9)
-            tens_digit = [random.randint(0, 9) * 10]
+            ones_digit = self.rng.randint(0, 9)
+            tens_digit = [self.rng.randint(0, 9) * 10]
 
             i = 0
             while i < modifier:
-                tens = random.randint(0, 9) * 10
+                tens = self.rng.randint(0, 9) * 10
                 tens_digit.append(tens)
                 i += 1
 
@@ -58,7 +63,7 @@ class Die(object):
                 result += tens_digit[1]
 
         else:
-            result = random.randint(1, 100)
+            result = self.rng.randint(1, 100)
 
         self.last_result = result
         return result
@@ -19,10 +19,24 @@ SHIFT_DATA = 4  # P4-P7
 class I2cLcd(LcdApi):
 
     # Implements a HD44780 character LCD connected via PCF8574 on I2C
+    #
+    # Each byte sent to the LCD is four PCF8574 writes: a nibble with E
+    # high then low, twice. Rather than a writeto() per nibble, writes are
+    # encoded into a preallocated buffer and sent together, one writeto()
+    # per command or byte outside putstr()/show(), and one per batch_size
+    # writes (or per row, for the async versions) inside them. The garbage collector only runs after init and
+    # after the clear and home commands, which already stall for 5 msec.
+
+    # LCD writes held in the buffer before it is sent
+    batch_size = 64
 
     def __init__(self, i2c, i2c_addr, num_lines, num_columns):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
+        self._buf = bytearray(4 * self.batch_size)
+        self._view = memoryview(self._buf)
+        self._len = 0
+        self._batching = False
         self.i2c.writeto(self.i2c_addr, bytes([0]))
         utime.sleep_ms(20)  # Allow LCD time to powerup
         # Send reset 3 times
@@ -42,49 +56,79 @@ class I2cLcd(LcdApi):
         self.hal_write_command(cmd)
         gc.collect()
 
+    def _sync(self):
+        # Sends the whole screen update in as few writeto() calls as possible
+        self._batching = True
+        try:
+            LcdApi._sync(self)
+        finally:
+            self._batching = False
+            self.hal_flush()
+
+    async def _sync_async(self):
+        self._batching = True
+        try:
+            await LcdApi._sync_async(self)
+        finally:
+            self._batching = False
+            self.hal_flush()
+
     def hal_write_init_nibble(self, nibble):
         # Writes an initialization nibble to the LCD.
         # This particular function is only used during initialization.
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E, byte]))
 
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
+        self.hal_flush()
         self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
 
     def hal_backlight_off(self):
         # Allows the hal layer to turn the backlight off
+        self.hal_flush()
         self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
 
     def hal_write_command(self, cmd):
         # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._encode(self.backlight << SHIFT_BACKLIGHT, cmd)
         if cmd <= 3:
             # The home and clear commands require the worst case delay of 4.1 msec
+            self.hal_flush()
             utime.sleep_ms(5)
-        gc.collect()
+            gc.collect()
+        elif not self._batching:
+            self.hal_flush()
 
     def hal_write_data(self, data):
         # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
\ No newline at end of file
+        self._encode(MASK_RS | (self.backlight << SHIFT_BACKLIGHT), data)
+        if not self._batching:
+            self.hal_flush()
+
+    def hal_sleep_us(self, usecs):
+        # Held back writes have to reach the LCD before the delay starts
+        self.hal_flush()
+        utime.sleep_us(usecs)
+
+    def hal_flush(self):
+        # Sends the buffered writes in a single writeto()
+        if self._len == len(self._buf):
+            self.i2c.writeto(self.i2c_addr, self._buf)
+        elif self._len:
+            self.i2c.writeto(self.i2c_addr, self._view[:self._len])
+        self._len = 0
+
+    def _encode(self, flags, byte):
+        # Appends the four PCF8574 writes that clock byte into the LCD
+        if self._len == len(self._buf):
+            self.hal_flush()
+        buf = self._buf
+        i = self._len
+        high = flags | (((byte >> 4) & 0x0f) << SHIFT_DATA)
+        low = flags | ((byte & 0x0f) << SHIFT_DATA)
+        buf[i] = high | MASK_E
+        buf[i + 1] = high
+        buf[i + 2] = low | MASK_E
+        buf[i + 3] = low
+        self._len = i + 4
\ No newline at end of file
@@ -3,6 +3,7 @@ credit: https://raw.githubusercontent.com/dhylands/python_lcd/master/lcd/lcd_api
 
 Provides an API for talking to HD44780 compatible character LCDs."""
 
+import asyncio
 import time
 
 
@@ -12,6 +13,10 @@ class LcdApi:
     them to the LCD.
 
     It is expected that a derived class will implement the hal_xxx functions.
+
+    A shadow framebuffer holds what is on the glass, so writes only send
+    the cells that change, and show() redraws a whole screen without the
+    slow clear command.
     """
 
     # The following constant names were lifted from the avrlib lcd.h
@@ -62,6 +67,11 @@ class LcdApi:
         self.cursor_y = 0
         self.implied_newline = False
         self.backlight = True
+        size = self.num_lines * self.num_columns
+        self._blank = b' ' * size
+        self.shadow = bytearray(self._blank)  # what the LCD is showing
+        self._frame = bytearray(size)  # the screen being drawn
+        self._address = None  # DDRAM address the LCD will write to next
         self.display_off()
         self.backlight_on()
         self.clear()
@@ -77,6 +87,8 @@ class LcdApi:
         self.hal_write_command(self.LCD_HOME)
         self.cursor_x = 0
         self.cursor_y = 0
+        self.shadow[:] = self._blank
+        self._address = 0
 
     def show_cursor(self):
         """Causes the cursor to be made visible."""
@@ -129,47 +141,150 @@ class LcdApi:
         """
         self.cursor_x = cursor_x
         self.cursor_y = cursor_y
+        addr = self._ddram_address(cursor_x, cursor_y)
+        self.hal_write_command(self.LCD_DDRAM | addr)
+        self._address = addr
+
+    def _ddram_address(self, cursor_x, cursor_y):
         addr = cursor_x & 0x3f
         if cursor_y & 1:
             addr += 0x40    # Lines 1 & 3 add 0x40
         if cursor_y & 2:    # Lines 2 & 3 add number of columns
             addr += self.num_columns
-        self.hal_write_command(self.LCD_DDRAM | addr)
+        return addr
 
     def putchar(self, char):
         """Writes the indicated character to the LCD at the current cursor
         position, and advances the cursor by one position.
         """
-        if char == '\n':
-            if self.implied_newline:
-                # self.implied_newline means we advanced due to a wraparound,
-                # so if we get a newline right after that we ignore it.
-                self.implied_newline = False
-            else:
-                self.cursor_x = self.num_columns
-        else:
-            self.hal_write_data(ord(char))
-            self.cursor_x += 1
-        if self.cursor_x >= self.num_columns:
-            self.cursor_x = 0
-            self.cursor_y += 1
-            self.implied_newline = (char != '\n')
-        if self.cursor_y >= self.num_lines:
-            self.cursor_y = 0
-        self.move_to(self.cursor_x, self.cursor_y)
+        self.putstr(char)
 
     def putstr(self, string):
         """Write the indicated string to the LCD at the current cursor
         position and advances the cursor position appropriately.
         """
+        self._frame[:] = self.shadow
+        self._draw(string)
+        self._sync()
+
+    def show(self, string):
+        """Makes the LCD look as if it had been cleared and then given
+        string with putstr(), sending only the cells that differ from what
+        is already showing.
+        """
+        self._frame[:] = self._blank
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self._draw(string)
+        self._sync()
+
+    async def putstr_async(self, string):
+        """putstr() for asyncio, other tasks run between the rows being sent.
+        Only one task should write to the LCD at a time.
+        """
+        self._frame[:] = self.shadow
+        self._draw(string)
+        await self._sync_async()
+
+    async def show_async(self, string):
+        """show() for asyncio, other tasks run between the rows being sent.
+        Only one task should write to the LCD at a time.
+        """
+        self._frame[:] = self._blank
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self._draw(string)
+        await self._sync_async()
+
+    def snapshot(self):
+        """Returns what the LCD is showing, to be put back by restore()."""
+        return bytes(self.shadow), self.cursor_x, self.cursor_y, self.implied_newline
+
+    def restore(self, snapshot):
+        """Puts back a screen saved by snapshot(), sending only the cells
+        that have changed since.
+        """
+        self._frame[:] = snapshot[0]
+        self.cursor_x, self.cursor_y, self.implied_newline = snapshot[1:]
+        self._sync()
+
+    def _draw(self, string):
+        """Lays string out into the frame, following the cursor, newline
+        and wraparound rules of the LCD.
+        """
+        frame = self._frame
+        columns = self.num_columns
         for char in string:
-            self.putchar(char)
+            if char == '\n':
+                if self.implied_newline:
+                    # self.implied_newline means we advanced due to a wraparound,
+                    # so if we get a newline right after that we ignore it.
+                    self.implied_newline = False
+                else:
+                    self.cursor_x = columns
+            else:
+                frame[self.cursor_y * columns + self.cursor_x] = ord(char) & 0xff
+                self.cursor_x += 1
+            if self.cursor_x >= columns:
+                self.cursor_x = 0
+                self.cursor_y += 1
+                self.implied_newline = (char != '\n')
+            if self.cursor_y >= self.num_lines:
+                self.cursor_y = 0
+
+    def _sync(self):
+        """Sends the cells where the frame differs from the shadow, then
+        leaves the LCD cursor at the logical cursor.
+        """
+        for row in range(self.num_lines):
+            self._sync_row(row)
+        self._sync_cursor()
+
+    async def _sync_async(self):
+        for row in range(self.num_lines):
+            if self._sync_row(row):
+                self.hal_flush()
+                await asyncio.sleep(0)
+        self._sync_cursor()
+
+    def _sync_row(self, row):
+        """Sends the changed cells of one row, moving the LCD's address only
+        to jump over runs of unchanged cells. Returns True if anything was sent.
+        """
+        frame = self._frame
+        shadow = self.shadow
+        start = row * self.num_columns
+        sent = False
+        for col in range(self.num_columns):
+            i = start + col
+            if frame[i] == shadow[i]:
+                continue
+            addr = self._ddram_address(col, row)
+            if self._address != addr:
+                # rewriting a single unchanged cell costs the same as a move
+                if (self._address == addr - 1 and col > 0
+                        and self._ddram_address(col - 1, row) == addr - 1):
+                    self.hal_write_data(shadow[i - 1])
+                else:
+                    self.hal_write_command(self.LCD_DDRAM | addr)
+            self.hal_write_data(frame[i])
+            shadow[i] = frame[i]
+            self._address = addr + 1
+            sent = True
+        return sent
+
+    def _sync_cursor(self):
+        addr = self._ddram_address(self.cursor_x, self.cursor_y)
+        if self._address != addr:
+            self.hal_write_command(self.LCD_DDRAM | addr)
+            self._address = addr
 
     def custom_char(self, location, charmap):
         """Write a character to one of the 8 CGRAM locations, available
         as chr(0) through chr(7).
         """
         location &= 0x7
+        self._address = None  # the LCD now points into CGRAM
         self.hal_write_command(self.LCD_CGRAM | (location << 3))
         self.hal_sleep_us(40)
         for i in range(8):
@@ -207,6 +322,13 @@ class LcdApi:
         """
         raise NotImplementedError
 
+    def hal_flush(self):
+        """Sends any writes the hal layer has been holding back.
+
+        If desired, a derived HAL class will implement this function.
+        """
+        pass
+
     def hal_sleep_us(self, usecs):
         """Sleep for some time (given in microseconds)."""
         time.sleep_us(usecs)
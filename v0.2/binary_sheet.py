@@ -0,0 +1,307 @@
+"""
+Compiled binary character sheets for fast boot.
+
+A .dks file is read with a single readinto() into a preallocated buffer
+and fields are read (and numbers updated) in place, with no text parsing.
+The JSON sheet stays the source of truth; compile it on the host with
+
+    python3 binary_sheet.py pulp_cthulhu_Ana_Engel.json
+
+Layout, little endian:
+
+    header   <4sHHHHII  magic b"DKS1", format version, flags,
+                        string count, node count, string table offset,
+                        node table offset
+    strings  (count + 1) <I end offsets, then the UTF-8 blob. Every key
+             and string value is stored once.
+    nodes    <HBBi per node: key string id, type, reserved, value.
+             Node 0 is the top of the sheet. A section's children are
+             stored next to each other, sorted by key, and its value
+             packs the first child index (low 16 bits) and child count
+             (high 16 bits). Numbers are fixed width 32 bit fields.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+import os
+import struct
+
+MAGIC = b"DKS1"
+FORMAT_VERSION = 1
+EXTENSION = ".dks"
+
+_HEADER = "<4sHHHHII"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_NODE = "<HBBi"
+_NODE_SIZE = struct.calcsize(_NODE)
+_NO_KEY = 0xFFFF
+
+# node types
+_NULL = 0
+_BOOL = 1
+_INT = 2
+_STR = 3
+_SECTION = 4
+_FLOAT = 5
+
+
+class SheetNode:
+    """
+    Read-only dict view of one section of a BinarySheet.
+
+    Numbers and booleans can be assigned in place since their fields
+    are fixed width; anything that changes the layout has to go
+    through the JSON sheet.
+    """
+
+    def __init__(self, sheet: "BinarySheet", index: int):
+        self._sheet = sheet
+        self._index = index
+        packed = sheet.node(index)[2]
+        self._first = packed & 0xFFFF
+        self._count = (packed >> 16) & 0xFFFF
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, key):
+        return self._sheet.find_child(self._first, self._count, key) >= 0
+
+    def __getitem__(self, key):
+        i = self._sheet.find_child(self._first, self._count, key)
+        if i < 0:
+            raise KeyError(key)
+        return self._sheet.value(i)
+
+    def __setitem__(self, key, value):
+        i = self._sheet.find_child(self._first, self._count, key)
+        if i < 0:
+            raise TypeError("binary sheets can't add keys, edit the JSON sheet")
+        self._sheet.write_number(i, value)
+
+    def get(self, key, default=None):
+        i = self._sheet.find_child(self._first, self._count, key)
+        return default if i < 0 else self._sheet.value(i)
+
+    def keys(self):
+        for i in range(self._first, self._first + self._count):
+            yield self._sheet.key(i)
+
+    def values(self):
+        for i in range(self._first, self._first + self._count):
+            yield self._sheet.value(i)
+
+    def items(self):
+        for i in range(self._first, self._first + self._count):
+            yield self._sheet.key(i), self._sheet.value(i)
+
+    def to_dict(self) -> dict:
+        """ Plain nested dicts, e.g. for json.dumps """
+        d = {}
+        for k, v in self.items():
+            d[k] = v.to_dict() if isinstance(v, SheetNode) else v
+        return d
+
+
+class BinarySheet:
+    def __init__(self, fpath: str):
+        with open(fpath, "rb") as file:
+            size = file.seek(0, 2)
+            file.seek(0)
+            self.buffer = bytearray(size)
+            file.readinto(self.buffer)
+        self._view = memoryview(self.buffer)
+
+        magic, version, _, self.num_strings, self.num_nodes, strings, nodes = struct.unpack_from(
+            _HEADER, self.buffer, 0
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{fpath} is not a version {FORMAT_VERSION} binary sheet")
+        self._string_offsets = strings
+        self._blob = strings + 4 * (self.num_strings + 1)
+        self._nodes = nodes
+        self.fpath = fpath
+
+    @classmethod
+    def is_binary(cls, fpath: str) -> bool:
+        try:
+            with open(fpath, "rb") as file:
+                return file.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    @classmethod
+    def for_sheet(cls, fpath: str):
+        """
+        The compiled form of a sheet, None when there isn't an up to date one.
+
+        :param: a .dks file, or a .json sheet that may have a compiled
+                copy next to it that is no older than the JSON
+        """
+        if cls.is_binary(fpath):
+            return cls(fpath)
+        binary_path = binary_path_for(fpath)
+        binary_time = _mtime(binary_path)
+        if binary_time is None or binary_time < (_mtime(fpath) or 0):
+            return None
+        if not cls.is_binary(binary_path):
+            return None
+        return cls(binary_path)
+
+    @property
+    def root(self) -> SheetNode:
+        return SheetNode(self, 0)
+
+    def node(self, index: int) -> tuple:
+        """ (key id, type, value) """
+        key_id, node_type, _, value = struct.unpack_from(_NODE, self.buffer, self._nodes + index * _NODE_SIZE)
+        return key_id, node_type, value
+
+    def string(self, string_id: int) -> str:
+        start, end = struct.unpack_from("<II", self.buffer, self._string_offsets + 4 * string_id)
+        return str(self._view[self._blob + start:self._blob + end], "utf-8")
+
+    def _string_bytes(self, string_id: int):
+        start, end = struct.unpack_from("<II", self.buffer, self._string_offsets + 4 * string_id)
+        return self._view[self._blob + start:self._blob + end]
+
+    def key(self, index: int) -> str:
+        return self.string(self.node(index)[0])
+
+    def value(self, index: int):
+        _, node_type, value = self.node(index)
+        if node_type == _INT:
+            return value
+        if node_type == _STR:
+            return self.string(value)
+        if node_type == _SECTION:
+            return SheetNode(self, index)
+        if node_type == _BOOL:
+            return value != 0
+        if node_type == _FLOAT:
+            return struct.unpack("<f", struct.pack("<i", value))[0]
+        return None
+
+    def find_child(self, first: int, count: int, key: str) -> int:
+        """ Binary search of a section's sorted children, -1 if key is missing """
+        target = key.encode()
+        lo, hi = first, first + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = bytes(self._string_bytes(self.node(mid)[0]))
+            if candidate == target:
+                return mid
+            if candidate < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def write_number(self, index: int, value):
+        """ Updates an int or bool field in place """
+        key_id, node_type, _ = self.node(index)
+        if node_type == _BOOL and isinstance(value, bool):
+            value = int(value)
+        elif node_type != _INT or isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError("binary sheets can only update numbers in place, edit the JSON sheet")
+        struct.pack_into(_NODE, self.buffer, self._nodes + index * _NODE_SIZE, key_id, node_type, 0, value)
+
+    def save(self, fpath: str = None):
+        """ Writes the buffer, including in place updates, back out """
+        with open(fpath or self.fpath, "wb") as file:
+            file.write(self.buffer)
+
+
+def _mtime(fpath: str):
+    try:
+        return os.stat(fpath)[8]
+    except OSError:
+        return None
+
+
+def binary_path_for(fpath: str) -> str:
+    """ pulp_cthulhu_sheet.json -> pulp_cthulhu_sheet.dks """
+    stem = fpath.rsplit(".", 1)[0] if "." in fpath.rsplit("/", 1)[-1] else fpath
+    return stem + EXTENSION
+
+
+def compile_sheet(sheet: dict) -> bytes:
+    """ Encodes a sorted sheet (JSONParser.load_json_file) into the binary format """
+    strings = {}
+    string_list = []
+
+    def intern(s: str) -> int:
+        string_id = strings.get(s)
+        if string_id is None:
+            string_id = len(string_list)
+            strings[s] = string_id
+            string_list.append(s)
+        return string_id
+
+    # breadth first so each section's children sit next to each other
+    nodes = [[_NO_KEY, _SECTION, 0]]
+    queue = [(0, sheet)]
+    while queue:
+        index, section = queue.pop(0)
+        first = len(nodes)
+        for k in sorted(section, key=lambda k: k.encode()):
+            v = section[k]
+            if isinstance(v, dict):
+                nodes.append([intern(k), _SECTION, 0])
+                queue.append((len(nodes) - 1, v))
+            elif isinstance(v, bool):
+                nodes.append([intern(k), _BOOL, int(v)])
+            elif isinstance(v, int):
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    raise ValueError(f"'{k}' does not fit in 32 bits")
+                nodes.append([intern(k), _INT, v])
+            elif isinstance(v, float):
+                nodes.append([intern(k), _FLOAT, struct.unpack("<i", struct.pack("<f", v))[0]])
+            elif isinstance(v, str):
+                nodes.append([intern(k), _STR, intern(v)])
+            elif v is None:
+                nodes.append([intern(k), _NULL, 0])
+            else:
+                raise TypeError(f"'{k}': {type(v).__name__} values are not supported")
+        if len(section) > 0xFFFF or first > 0xFFFF:
+            raise ValueError("sheet too large for the binary format")
+        nodes[index][2] = struct.unpack("<i", struct.pack("<I", first | (len(section) << 16)))[0]
+
+    blob = bytearray()
+    offsets = [0]
+    for s in string_list:
+        blob += s.encode()
+        offsets.append(len(blob))
+
+    strings_offset = _HEADER_SIZE
+    nodes_offset = strings_offset + 4 * len(offsets) + len(blob)
+    out = bytearray(struct.pack(
+        _HEADER, MAGIC, FORMAT_VERSION, 0, len(string_list), len(nodes), strings_offset, nodes_offset
+    ))
+    for offset in offsets:
+        out += struct.pack("<I", offset)
+    out += blob
+    for key_id, node_type, value in nodes:
+        out += struct.pack(_NODE, key_id, node_type, 0, value)
+    return bytes(out)
+
+
+# Host side compiler #
+if __name__ == "__main__":
+    import sys
+    from json_parser import JSONParser
+    from sheet_schema import schema_for
+
+    for json_path in sys.argv[1:]:
+        out_path = binary_path_for(json_path)
+        sheet = JSONParser.load_json_file(json_path)
+        # the device skips checking compiled sheets, so check them here
+        schema_for(sheet).validate(sheet)
+        data = compile_sheet(sheet)
+        with open(out_path, "wb") as out_file:
+            out_file.write(data)
+        print(f"{json_path} -> {out_path} ({len(data)} bytes)")
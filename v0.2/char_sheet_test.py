@@ -5,6 +5,7 @@ __author__ = "Nathan Winslow"
 __copyright__ = "MIT"
 
 from character_sheet import PulpCharacter
+from json_parser import PathSelector
         
 # Test values        
 example_character = 'pulp_cthulhu_sheet.json'
@@ -18,6 +19,16 @@ def print_skills_test(skill_list):
         print(skill)
 
 
+def path_selector_test(sheet):
+    print('\n----------- Path Selectors -----------')
+    weapon_names = list(PathSelector.select(sheet, "Combat.Weapons.*.Name"))
+    # ** in the middle matches any depth, so both find the weapon names
+    assert list(PathSelector.select(sheet, "Combat.**.Name")) == weapon_names
+    assert list(PathSelector.select(sheet, "**.Name")) == [sheet["Name"]] + weapon_names
+    for path, value in PathSelector.select_items(sheet, "**.Name"):
+        print(f"{'.'.join(path)}: {value}")
+
+
 print(f"{my_character.name}({my_character.pronoun}), {my_character.age}")
 print(f"{test_key}: {my_character.get_value_at(test_key)}")
-
+path_selector_test(my_character.character_sheet)
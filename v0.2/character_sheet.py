@@ -4,18 +4,179 @@ Module for Character sheet manipulation
 __author__ = "Nathan Winslow"
 __copyright__ = "MIT"
 
-from json_parser import JSONParser
+import json
+import os
+from json_parser import JSONParser, LazySheet, PathSelector, SECTION_TYPES
+from binary_sheet import BinarySheet
+from sheet_schema import CTHULHU_SCHEMA, PULP_SCHEMA
+from sheet_journal import SheetJournal, SHEET_PATHS, HIT_POINTS, MAGIC_POINTS, SANITY, LUCK, WEAPON, SKILL_TICK, replace_file
 from dice import CthulhuDice
+from rng import RNG, RollPool
+
+class AmbiguousKeyError(KeyError):
+    """ Raised when a key appears at more than one place in a sheet """
+
+    def __init__(self, key: str, paths: list):
+        super().__init__(key)
+        self.key = key
+        self.paths = paths
+
+    def __str__(self):
+        places = ", ".join(".".join(path) for path in self.paths)
+        return f"'{self.key}' is ambiguous, found at {places}"
+
 
 class PlayerCharacter:
-    def __init__(self, fpath: str):
-        self.character_sheet = JSONParser.load_json_file(fpath)
+    # SheetSchema sheets are checked against as they load, None to skip
+    schema = None
+
+    def __init__(self, fpath: str, lazy: bool = False):
+        """
+        :param: sheet to load
+        :param: parse top level sections of a JSON sheet on first use
+        """
+        self.fpath = fpath
+        # a compiled .dks copy is read in place, the JSON is the fallback
+        self.binary_sheet = BinarySheet.for_sheet(fpath)
+        if self.binary_sheet is not None:
+            self.character_sheet = self.binary_sheet.root
+        elif lazy:
+            self.character_sheet = LazySheet(fpath)
+        else:
+            self.character_sheet = JSONParser.load_json_file(fpath)
+        # compiled sheets were checked when they were compiled
+        if self.schema is not None and self.binary_sheet is None:
+            if lazy:
+                self.schema.watch(self.character_sheet)
+            else:
+                self.schema.validate(self.character_sheet)
+        # key -> every path it appears at, built once so lookups skip the search.
+        # Lazy sheets index one section at a time until a lookup needs them all.
+        self._key_index = None
+        self._section_indexes = {}  # section -> key index of just that section
+        if not isinstance(self.character_sheet, LazySheet):
+            self._key_index = JSONParser.build_key_index(self.character_sheet)
+        # bumped by every change to the sheet, invalidates the cached views
+        self.version = 0
+        self._views = {}  # name -> (version, tuple)
 
     def __call__(self):
+        if not isinstance(self.character_sheet, dict):
+            return self.character_sheet.to_dict()
         return self.character_sheet
     
-    def get_value_at(self, key: str):
-        return JSONParser.get_value_at_key(self.character_sheet, key)
+    def get_value_at(self, key: str, within: str = None):
+        """
+        Value of key anywhere in the sheet, None if it isn't there.
+
+        :param: key to look up
+        :param: only look inside this top level section, e.g. "Skills"
+        :raises: AmbiguousKeyError if the key is in more than one place
+        """
+        path = self.path_to(key, within)
+        if path is None:
+            return None
+        return JSONParser.get_value_at_path(self.character_sheet, path)
+
+    def path_to(self, key: str, within: str = None):
+        """ Path tuple to key, see get_value_at """
+        if self._key_index is None and within is not None:
+            paths = self._section_index(within).get(key)
+            if key == within:
+                paths = [(within,)] + (paths or [])
+        else:
+            paths = self.key_index.get(key)
+            if paths is not None and within is not None:
+                paths = [path for path in paths if path[0] == within]
+        if not paths:
+            return None
+        if len(paths) > 1:
+            raise AmbiguousKeyError(key, paths)
+        return paths[0]
+
+    @property
+    def key_index(self) -> dict:
+        """ key -> every path it appears at, loads the whole of a lazy sheet """
+        if self._key_index is None:
+            self._key_index = JSONParser.build_key_index(self.character_sheet)
+        return self._key_index
+
+    def _section_index(self, section: str) -> dict:
+        index = self._section_indexes.get(section)
+        if index is None:
+            index = {}
+            value = self.character_sheet.get(section)
+            if isinstance(value, SECTION_TYPES):
+                JSONParser._index_into(value, (section,), index)
+            self._section_indexes[section] = index
+        return index
+
+    @property
+    def ambiguous_keys(self) -> dict:
+        """ key -> paths for every key that appears more than once """
+        return {k: paths for k, paths in self.key_index.items() if len(paths) > 1}
+
+    def set_value_at_path(self, path: tuple, value):
+        """
+        Sets a value in the sheet, keeping the key index in step when
+        the change adds a key or swaps a section.
+
+        :raises: TypeError for anything but a number on a compiled sheet
+        """
+        parent = JSONParser.get_value_at_path(self.character_sheet, path[:-1])
+        key = path[-1]
+        restructured = key not in parent or isinstance(parent[key], SECTION_TYPES) or isinstance(value, dict)
+        parent[key] = value
+        if restructured:
+            self._section_indexes = {}
+            if self._key_index is not None:
+                self._key_index = JSONParser.build_key_index(self.character_sheet)
+        self.mark_changed()
+
+    def mark_changed(self):
+        """ Call after editing character_sheet directly so cached views are rebuilt """
+        self.version += 1
+
+    def cached_view(self, name: str, build) -> tuple:
+        """
+        Derived data built once per sheet version.
+
+        :param: cache slot name
+        :param: callable returning an iterable, stored as a tuple
+        """
+        cached = self._views.get(name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        view = tuple(build())
+        self._views[name] = (self.version, view)
+        return view
+
+    def change_value_at_path(self, path: tuple, amount: int):
+        """ Adds amount to the number at path """
+        self.set_value_at_path(path, JSONParser.get_value_at_path(self.character_sheet, path) + amount)
+
+    def save(self) -> int:
+        """
+        Atomically writes the sheet back over the file it was loaded from.
+
+        A sheet read from its compiled copy writes the JSON as well, the
+        source of truth the roster and compiler read, then the copy, so
+        the copy is no older than the JSON and is still used.
+
+        :return: bytes written
+        """
+        written = 0
+        if self.binary_sheet is None or self.binary_sheet.fpath != self.fpath:
+            with open(self.fpath + ".tmp", "w") as file:
+                json.dump(self(), file)
+            replace_file(self.fpath + ".tmp", self.fpath)
+            written += os.stat(self.fpath)[6]
+        if self.binary_sheet is not None:
+            fpath = self.binary_sheet.fpath
+            self.binary_sheet.save(fpath + ".tmp")
+            replace_file(fpath + ".tmp", fpath)
+            written += os.stat(fpath)[6]
+        return written
         
     @property
     def age(self):
@@ -27,13 +188,105 @@ class PlayerCharacter:
     
 
 class CthulhuCharacter(PlayerCharacter):
+    schema = CTHULHU_SCHEMA
 
-    def __init__(self, fpath: str):
-        super().__init__(fpath)  
+    def __init__(self, fpath: str, lazy: bool = False, journal: bool = False):
+        """
+        :param: sheet to load
+        :param: parse top level sections of a JSON sheet on first use
+        :param: keep changes in a journal beside the sheet, replayed here
+        """
+        super().__init__(fpath, lazy)
+        # each investigator rolls from their own reproducible stream,
+        # pre-rolled so the roll itself is just a pop from the pool
+        self.rng = RollPool(RNG.stream(self.name))
+        self.dice = CthulhuDice.with_rng(self.rng)
         self.prev_skill_modifier: int = 0  # used when pushing rolls.
         self.current_weapon: dict = {}
+        self.current_weapon_number: int = 0
         self.db: tuple = self.damage_bonus()
         self.skills_to_improve: list[str] = []  # Used during Development phase
+        self.journal = None
+        # set by a WriteBehind, which then decides when changes are written
+        self.write_behind = None
+        self._dirty = {}  # kind -> [summed delta, latest value]
+        self._dirty_ticks = []
+        if journal:
+            self.journal = SheetJournal(fpath)
+            for record in self.journal.records():
+                self._replay(*record)
+
+    def _replay(self, kind: int, delta: int, value: int, name: str):
+        if kind in SHEET_PATHS:
+            self.set_value_at_path(SHEET_PATHS[kind], value)
+        elif kind == WEAPON:
+            self._select_weapon(value)
+        elif kind == SKILL_TICK:
+            self._tick(name)
+        # kinds from newer versions are skipped
+
+    def _change(self, kind: int, amount: int):
+        path = SHEET_PATHS[kind]
+        self.change_value_at_path(path, amount)
+        self._record(kind, amount, JSONParser.get_value_at_path(self.character_sheet, path))
+
+    def _record(self, kind: int, delta: int, value: int, name: str = ""):
+        """ Journals a change now, or marks it dirty when a WriteBehind is tracking us """
+        if self.journal is None:
+            return
+        if self.write_behind is None:
+            self.journal.append(kind, delta, value, name)
+            return
+        if kind == SKILL_TICK:
+            self._dirty_ticks.append(name)
+        else:
+            pending = self._dirty.get(kind)
+            if pending is None:
+                self._dirty[kind] = [delta, value]
+            else:
+                pending[0] += delta
+                pending[1] = value
+        self.write_behind.touch()
+
+    @property
+    def dirty(self) -> bool:
+        """ True while changes are waiting to be journaled """
+        return bool(self._dirty or self._dirty_ticks)
+
+    def flush(self) -> int:
+        """
+        Journals the dirty fields, one record per field however often it changed.
+
+        :return: bytes written
+        """
+        if not self.dirty:
+            return 0
+        records = [SheetJournal.encode(kind, delta, value) for kind, (delta, value) in self._dirty.items()]
+        for skill in self._dirty_ticks:
+            records.append(SheetJournal.encode(SKILL_TICK, 0, 0, skill))
+        self._dirty = {}
+        self._dirty_ticks = []
+        return self.journal.append_records(records)
+
+    def compact(self) -> int:
+        """
+        Writes the sheet with every change so far as the new base sheet
+        and starts the journal over with what the sheet can't hold.
+
+        :return: bytes written
+        """
+        written = self.save()
+        if self.journal is None:
+            return written
+        records = []
+        if self.current_weapon_number:
+            records.append(SheetJournal.encode(WEAPON, 0, self.current_weapon_number))
+        for skill in self.skills_to_improve:
+            records.append(SheetJournal.encode(SKILL_TICK, 0, 0, skill))
+        # anything dirty is in the new base sheet or the records above
+        self._dirty = {}
+        self._dirty_ticks = []
+        return written + self.journal.rewrite(records)
     
     def damage_bonus(self) -> tuple:
         """ Returns a tuple (num_dice, num_side) such that -2 and -1 are const"""
@@ -51,27 +304,38 @@ class CthulhuCharacter(PlayerCharacter):
 
     def roll_damage(self, dmg_die: tuple) -> int:
         if self.db[0] == 0:
-            return CthulhuDice.roll(*dmg_die)
+            return self.dice.roll(*dmg_die)
         else:  # to prevent empty range
-            return CthulhuDice.roll_multiple([dmg_die, self.db])
+            return self.dice.roll_multiple([dmg_die, self.db])
+
+    def roll_weapon_damage(self, weapon: dict = None) -> int:
+        """
+        Rolls the damage string of a weapon, e.g. "1d3 + db".
+
+        Defaults to the current weapon. Damage never goes below 0.
+        """
+        if weapon is None:
+            weapon = self.current_weapon
+        # the sheets store the damage under "Damage " (trailing space)
+        damage = weapon.get("Damage ", weapon.get("Damage", ""))
+        return max(0, self.dice.roll_expression(damage, self.db))
 
     def cast_spell(self, spell_name: str):
         print(f"Casting {spell_name}!")
         # TODO: Flesh out spell logic
 
     def roll_skill(self, bonus_die: int, penalty_die: int):
-        return CthulhuDice.roll_skill(bonus_die, penalty_die)
+        return self.dice.roll_skill(bonus_die, penalty_die)
 
     def get_skill_at_difficulty(self, skill_val: int, level: str) -> int:
-        if level == "Hard":
-            return skill_val // 2
-        elif level == "Extreme":
-            return skill_val // 5
-        else:
-            return skill_val
+        return CthulhuDice.skill_at_difficulty(skill_val, level)
 
     def get_fumble(self, skill_val):
-        return 100 if skill_val >= 50 else 96
+        return CthulhuDice.fumble_threshold(skill_val)
+
+    def skill_odds(self, skill: str, bonus_die: int = 0, penalty_die: int = 0) -> dict:
+        """ Exact odds of each result level for one of this character's skills """
+        return CthulhuDice.odds(self.get_value_at(skill, "Skills"), bonus_die, penalty_die)
     
     def change_hit_points(self, amount: int):
         """
@@ -80,32 +344,49 @@ class CthulhuCharacter(PlayerCharacter):
         For taking damage, pass in a negative
         integer.
         """
-        self.character_sheet['Characteristics']['Hit Points']['Current'] += amount
+        self._change(HIT_POINTS, amount)
 
     def change_magic_points(self, amount: int):
         """ same behavior as change_hit_points """
-        self.character_sheet['Characteristics']['Magic Points']['Current'] += amount
+        self._change(MAGIC_POINTS, amount)
     
     def change_sanity(self, amount: int):
         """ same behavior as change_hit_points """
-        self.character_sheet['Characteristics']['Sanity']['Current'] += amount
+        self._change(SANITY, amount)
+
+    def tick_skill(self, skill: str):
+        """ Marks a skill for an improvement check in the Development phase """
+        if self._tick(skill):
+            self._record(SKILL_TICK, 0, 0, skill)
+
+    def _tick(self, skill: str) -> bool:
+        if skill in self.skills_to_improve:
+            return False
+        self.skills_to_improve.append(skill)
+        return True
     
-    def get_weapon_names(self):
-        w_names = []
-        for i in range(1, len(self.weapons) + 1):
-            w_names.append(self.weapons[f"Weapon {i}"]["Name"])
-        return w_names
+    def get_weapon_names(self) -> tuple:
+        return self.cached_view(
+            "weapon names", lambda: PathSelector.select(self.character_sheet, "Combat.Weapons.*.Name")
+        )
 
     def set_current_weapon(self, selection: int):
+        self._select_weapon(selection)
+        self._record(WEAPON, 0, selection)
+
+    def _select_weapon(self, selection: int):
         self.current_weapon = self.weapons[f"Weapon {selection}"]
+        self.current_weapon_number = selection
 
     @property
     def pronoun(self):
         return self.character_sheet['Pronoun']
     
     @property
-    def skills(self):
-        return JSONParser.get_keys(self.character_sheet['Skills'])
+    def skills(self) -> tuple:
+        return self.cached_view(
+            "skills", lambda: JSONParser.pretty_print_keys(self.character_sheet['Skills'])
+        )
 
     @property 
     def weapons(self):
@@ -129,21 +410,24 @@ class CthulhuCharacter(PlayerCharacter):
     
         
 class PulpCharacter(CthulhuCharacter):
+    schema = PULP_SCHEMA
 
-    def __init__(self, fpath: str):
-        super().__init__(fpath)
+    def __init__(self, fpath: str, lazy: bool = False, journal: bool = False):
+        super().__init__(fpath, lazy, journal)
     
     # Modifiers
     def change_luck(self, amount: int):
         """ similar to other change methods """
-        self.character_sheet["Characteristics"]["Luck"] += amount
+        self._change(LUCK, amount)
     
     @property
     def archetype(self):
         return self.character_sheet["Archetype"]   
     
     @property
-    def talents(self):
-        return JSONParser.get_keys(self.character_sheet['Pulp Talents'])
+    def talents(self) -> tuple:
+        return self.cached_view(
+            "talents", lambda: JSONParser.pretty_print_keys(self.character_sheet['Pulp Talents'])
+        )
     
 
@@ -0,0 +1,349 @@
+"""
+Monte Carlo combat simulator for Call of Cthulhu encounters.
+
+Pits investigators loaded from character sheets against opponent stat
+blocks and reports how long fights last and who walks away. Meant to be
+run on the host before a session; trials are spread across a process
+pool when multiprocessing is available.
+
+Opponent stat block format (a dict, or a list of them in a JSON file):
+
+    {
+        "Name": "Cultist",
+        "HP": 11,
+        "DEX": 50,
+        "Dodge": 25,
+        "Damage Bonus": "0",
+        "Attacks": [
+            {"Name": "Knife", "Skill": 40, "Damage": "1d4 + DB"},
+            {"Name": ".38 Revolver", "Skill": 30, "Damage": "1d10", "Dodgeable": false}
+        ]
+    }
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+import json
+from dice import CthulhuDice, DiceExpression
+from distribution import DistributionEngine
+from json_parser import JSONParser
+from rng import Stream
+
+# Skills used for sheet weapons, which don't record the skill they use.
+# Weapons with a range are treated as firearms, which can't be dodged.
+MELEE_SKILL = "Fighting (Brawl)"
+FIREARM_SKILL = "Handgun"
+
+
+def parse_damage_bonus(damage_bonus: str) -> tuple:
+    """ "+1D4", "-1" or "0" -> a damage bonus tuple like CthulhuCharacter.db """
+    dice = DiceExpression.compile(damage_bonus).dice()
+    if not dice:
+        return (0, 0)
+    if len(dice) > 1:
+        raise ValueError(f"damage bonus must be a single term, not '{damage_bonus}'")
+    return dice[0]
+
+
+class Attack:
+    def __init__(self, name: str, skill: int, damage: str, dodgeable: bool = True):
+        self.name = name
+        self.skill = skill
+        self.damage = damage
+        self.dodgeable = dodgeable
+
+
+class Combatant:
+    """
+    Plain data for one side of a fight, cheap to send to worker processes.
+
+    Only the attack with the highest skill is used, every round. Other
+    attacks are kept but never chosen, and ammo, reloading, multiple shots
+    per round and malfunctions aren't modelled, so firearms never run dry.
+    """
+
+    def __init__(self, name: str, hp: int, dex: int, dodge: int, db: tuple, attacks: list[Attack]):
+        if not attacks:
+            raise ValueError(f"{name} has no usable attacks")
+        self.name = name
+        self.hp = hp
+        self.dex = dex
+        self.dodge = dodge
+        self.db = db
+        self.attacks = attacks
+        self.attack = max(attacks, key=lambda a: a.skill)
+
+    @classmethod
+    def from_character(cls, character) -> "Combatant":
+        """ :param: a CthulhuCharacter or PulpCharacter """
+        sheet = character.character_sheet
+        skills = sheet["Skills"]
+        hp = character.current_hp
+        if hp <= 0:
+            hp = sheet["Characteristics"]["Hit Points"]["Maximum"]
+        if hp <= 0:
+            hp = (sheet["Characteristics"]["CON"] + sheet["Characteristics"]["SIZ"]) // 10
+
+        attacks = []
+        for weapon in character.weapons.values():
+            damage = weapon.get("Damage ", weapon.get("Damage", ""))
+            if not weapon["Name"] or not damage:
+                continue
+            firearm = bool(weapon.get("Range"))
+            skill_name = weapon.get("Skill", FIREARM_SKILL if firearm else MELEE_SKILL)
+            skill = JSONParser.get_value_at_key(skills, skill_name) or 0
+            attacks.append(Attack(weapon["Name"], skill, damage, not firearm))
+
+        return cls(
+            character.name,
+            hp,
+            sheet["Characteristics"]["DEX"],
+            skills.get("Dodge", 0),
+            character.db,
+            attacks,
+        )
+
+    @classmethod
+    def from_stat_block(cls, block: dict) -> "Combatant":
+        attacks = []
+        for attack in block["Attacks"]:
+            attacks.append(Attack(
+                attack["Name"],
+                attack["Skill"],
+                attack["Damage"],
+                attack.get("Dodgeable", True),
+            ))
+        return cls(
+            block["Name"],
+            block["HP"],
+            block.get("DEX", 50),
+            block.get("Dodge", 0),
+            parse_damage_bonus(str(block.get("Damage Bonus", "0"))),
+            attacks,
+        )
+
+    @classmethod
+    def load_stat_blocks(cls, fpath: str) -> list:
+        with open(fpath, "r") as file:
+            blocks = json.load(file)
+        if isinstance(blocks, dict):
+            blocks = [blocks]
+        return [cls.from_stat_block(block) for block in blocks]
+
+
+class CombatReport:
+    """
+    Aggregate results, kept as sums and counts so reports from separate
+    worker processes can be merged.
+    """
+
+    def __init__(self, names: list[str], num_investigators: int, max_rounds: int):
+        self.names = names
+        self.num_investigators = num_investigators
+        self.max_rounds = max_rounds
+        self.trials = 0
+        self.investigator_wins = 0
+        self.fight_lengths = [0] * (max_rounds + 1)  # rounds -> trials
+        self.survived = [0] * len(names)
+        self.incapacitated_rounds = [0] * len(names)  # sum over trials they went down
+
+    def merge(self, other: "CombatReport"):
+        self.trials += other.trials
+        self.investigator_wins += other.investigator_wins
+        for i in range(len(self.fight_lengths)):
+            self.fight_lengths[i] += other.fight_lengths[i]
+        for i in range(len(self.names)):
+            self.survived[i] += other.survived[i]
+            self.incapacitated_rounds[i] += other.incapacitated_rounds[i]
+
+    def _share(self, count: int) -> float:
+        """ count / trials, 0.0 for a report with no trials """
+        return count / self.trials if self.trials else 0.0
+
+    @property
+    def mean_rounds(self) -> float:
+        return self._share(sum(r * n for r, n in enumerate(self.fight_lengths)))
+
+    def rounds_percentile(self, pct: float) -> int:
+        target = pct * self.trials / 100
+        running = 0
+        for rounds, count in enumerate(self.fight_lengths):
+            running += count
+            if running >= target:
+                return rounds
+        return self.max_rounds
+
+    def survival_probability(self, index: int) -> float:
+        return self._share(self.survived[index])
+
+    def mean_rounds_to_incapacitation(self, index: int):
+        """ Average round the combatant went down in, None if they never did """
+        downed = self.trials - self.survived[index]
+        if downed == 0:
+            return None
+        return self.incapacitated_rounds[index] / downed
+
+    def summary(self) -> list[str]:
+        lines = [
+            f"{self.trials} trials, investigators win {self._share(self.investigator_wins):.1%}",
+            f"rounds: mean {self.mean_rounds:.2f}, median {self.rounds_percentile(50)}, "
+            f"90th percentile {self.rounds_percentile(90)}",
+        ]
+        for i, name in enumerate(self.names):
+            side = "investigator" if i < self.num_investigators else "opponent"
+            down = self.mean_rounds_to_incapacitation(i)
+            down = "never down" if down is None else f"down by round {down:.2f} on average"
+            lines.append(f"{name} ({side}): survives {self.survival_probability(i):.1%}, {down}")
+        return lines
+
+
+def _simulate(investigators: list, opponents: list, trials: int, seed: int, max_rounds: int) -> CombatReport:
+    """ Runs trials in this process, used directly or by pool workers """
+    dice = CthulhuDice.with_rng(Stream(seed))
+    combatants = investigators + opponents
+    sides = [0] * len(investigators) + [1] * len(opponents)
+    # act in DEX order, highest first
+    order = sorted(range(len(combatants)), key=lambda i: -combatants[i].dex)
+    plans = [DiceExpression.compile(c.attack.damage) for c in combatants]
+    max_damage = []
+    for c, plan in zip(combatants, plans):
+        if plan.keeps:
+            max_damage.append(None)
+        else:
+            max_damage.append(DistributionEngine.get(plan.dice(c.db)).max)
+
+    report = CombatReport([c.name for c in combatants], len(investigators), max_rounds)
+    for _ in range(trials):
+        hp = [c.hp for c in combatants]
+        down_round = [0] * len(combatants)
+        rounds = max_rounds
+        for round_num in range(1, max_rounds + 1):
+            for i in order:
+                if hp[i] <= 0:
+                    continue
+                targets = [j for j in range(len(combatants)) if sides[j] != sides[i] and hp[j] > 0]
+                if not targets:
+                    break
+                target = targets[dice.rng.randint(0, len(targets) - 1)]
+                attacker = combatants[i]
+                level = dice.success_level(dice.roll_skill(0, 0), attacker.attack.skill)
+                if level == 0:
+                    continue
+                if attacker.attack.dodgeable:
+                    # the defender wins ties when dodging
+                    dodge = dice.success_level(dice.roll_skill(0, 0), combatants[target].dodge)
+                    if dodge >= level:
+                        continue
+                if level >= 3 and max_damage[i] is not None:  # extreme: max damage
+                    damage = max_damage[i]
+                else:
+                    damage = max(0, dice.roll_plan(plans[i], attacker.db))
+                hp[target] -= damage
+                if hp[target] <= 0:
+                    down_round[target] = round_num
+
+            standing = [0, 0]
+            for j in range(len(combatants)):
+                if hp[j] > 0:
+                    standing[sides[j]] += 1
+            if standing[0] == 0 or standing[1] == 0:
+                rounds = round_num
+                break
+
+        report.trials += 1
+        report.fight_lengths[rounds] += 1
+        if any(hp[j] > 0 for j in range(len(investigators))) and not any(
+            hp[j] > 0 for j in range(len(investigators), len(combatants))
+        ):
+            report.investigator_wins += 1
+        for j in range(len(combatants)):
+            if hp[j] > 0:
+                report.survived[j] += 1
+            else:
+                report.incapacitated_rounds[j] += down_round[j]
+    return report
+
+
+def _simulate_chunk(args: tuple) -> CombatReport:
+    return _simulate(*args)
+
+
+class CombatSimulator:
+    def __init__(self, investigators: list, opponents: list, max_rounds: int = 20):
+        """
+        :param: CthulhuCharacter objects or Combatants
+        :param: Combatants or stat block dicts
+        :param: fights still going after this many rounds are cut off
+        """
+        self.investigators = [
+            c if isinstance(c, Combatant) else Combatant.from_character(c) for c in investigators
+        ]
+        self.opponents = [
+            c if isinstance(c, Combatant) else Combatant.from_stat_block(c) for c in opponents
+        ]
+        self.max_rounds = max_rounds
+
+    def run(self, trials: int, seed: int = None, processes: int = None, chunk_size: int = 1000) -> CombatReport:
+        """
+        Simulates trials fights.
+
+        Trials are split into chunks with seeds drawn from seed, so the
+        same seed gives the same report however many processes are used.
+
+        :param: number of fights
+        :param: master seed, random if None
+        :param: worker processes, None for one per CPU, 1 to stay in process
+        :param: trials per chunk handed to a worker
+        """
+        if trials <= 0:
+            raise ValueError(f"trials must be at least 1, not {trials}")
+        seeder = Stream(seed)
+        chunks = []
+        remaining = trials
+        while remaining > 0:
+            size = min(chunk_size, remaining)
+            chunks.append((self.investigators, self.opponents, size, seeder.next_u32(), self.max_rounds))
+            remaining -= size
+
+        pool = None
+        if processes != 1 and len(chunks) > 1:
+            try:
+                from multiprocessing import Pool
+                pool = Pool(processes)
+            except (ImportError, OSError):  # MicroPython, or no process support
+                pool = None
+
+        if pool is None:
+            results = [_simulate_chunk(chunk) for chunk in chunks]
+        else:
+            with pool:
+                results = pool.map(_simulate_chunk, chunks)
+
+        report = CombatReport(
+            [c.name for c in self.investigators + self.opponents],
+            len(self.investigators),
+            self.max_rounds,
+        )
+        for result in results:
+            report.merge(result)
+        return report
+
+
+# Example run #
+if __name__ == "__main__":
+    import sys
+    from character_sheet import PulpCharacter
+
+    sheets = sys.argv[1:] or ["pulp_cthulhu_sheet.json"]
+    cultist = {
+        "Name": "Cultist",
+        "HP": 11,
+        "DEX": 50,
+        "Dodge": 25,
+        "Damage Bonus": "0",
+        "Attacks": [{"Name": "Knife", "Skill": 40, "Damage": "1d4 + DB"}],
+    }
+    sim = CombatSimulator([PulpCharacter(sheet) for sheet in sheets], [cultist, cultist])
+    for line in sim.run(10_000).summary():
+        print(line)
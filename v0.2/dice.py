@@ -1,24 +1,274 @@
 """
-Classes for simulating Dice pools in TTRPGs 
+Classes for simulating Dice pools in TTRPGs
 """
 
 __author__ = "Nathan Winslow"
 __copyright__ = "MIT"
 
-from random import seed, randint
+from array import array
+from lru import LRUCache
+from math import cos, log, pi, sqrt
+from rng import RNG
+from distribution import AliasCache
 
-seed()
+try:  # only available on the host, never on the Pico
+    import numpy as np
+except ImportError:
+    np = None
+
+# Upper bound on the number of dice drawn by numpy in one go, keeps
+# huge batches (e.g. 200d6 x 100k trials) from allocating gigabytes.
+_BATCH_CHUNK = 1 << 20
+
+
+def _zeroed_results(trials: int):
+    """ Array of `trials` zeros in the best storage available """
+    if np is not None:
+        return np.zeros(trials, dtype=np.int32)
+    return array('h', (0 for _ in range(trials)))
+
+
+class RollPlan:
+    """
+    A compiled dice expression.
+
+    Every term is (num_dice, num_sides, keep) using the Dice conventions:
+    a negative num_dice subtracts the term, num_sides of 1 makes it the
+    constant num_dice, and keep is 0 to sum every die, +k to keep the k
+    highest or -k to keep the k lowest. The DB placeholder is filled in
+    with the character's damage bonus tuple at roll time.
+    """
+
+    def __init__(self, expression: str, terms: tuple, db_signs: tuple):
+        self.expression = expression
+        self.terms = terms
+        self.db_signs = db_signs
+
+    @property
+    def uses_db(self) -> bool:
+        return len(self.db_signs) > 0
+
+    @property
+    def keeps(self) -> bool:
+        for term in self.terms:
+            if term[2] != 0:
+                return True
+        return False
+
+    def terms_with(self, db: tuple = (0, 0)) -> tuple:
+        """ Terms with the DB placeholder replaced by the given damage bonus """
+        if not self.db_signs:
+            return self.terms
+        return self.terms + tuple((sign * db[0], db[1], 0) for sign in self.db_signs)
+
+    def dice(self, db: tuple = (0, 0)) -> list[tuple]:
+        """
+        (num_dice, num_sides) list for roll_multiple or the distribution engine.
+
+        Keep highest/lowest terms cannot be expressed as a plain sum of dice.
+        """
+        if self.keeps:
+            raise ValueError(f"'{self.expression}' keeps dice, it is not a plain sum")
+        return [(num_dice, num_sides) for num_dice, num_sides, _ in self.terms_with(db)]
+
+
+class DiceExpression:
+    """
+    Parser for dice strings such as "1D10+1D4+2", "2d6 + DB" or "4d6kh3".
+
+    Supported terms:
+        NdM     N dice with M sides, N defaults to 1 and d% is a d100
+        NdMkhK  keep the K highest dice, "k" alone also keeps highest
+        NdMklK  keep the K lowest dice
+        N       a constant
+        DB      the character's damage bonus
+    joined by + or -. Case and whitespace are ignored.
+
+    Compiled plans are cached by expression string so rolling the same
+    weapon again skips parsing.
+    """
+
+    _cache = LRUCache(32)
+
+    @classmethod
+    def compile(cls, expression: str) -> RollPlan:
+        plan = cls._cache.get(expression)
+        if plan is None:
+            plan = cls._parse(expression)
+            cls._cache.put(expression, plan)
+        return plan
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def _parse(cls, expression: str) -> RollPlan:
+        text = expression.replace(" ", "").lower()
+        if not text:
+            raise ValueError("empty dice expression")
+
+        terms = []
+        db_signs = []
+        pos = 0
+        sign = 1
+        if text[0] in "+-":
+            sign = -1 if text[0] == "-" else 1
+            pos = 1
+
+        while True:
+            if text.startswith("db", pos):
+                db_signs.append(sign)
+                pos += 2
+            else:
+                pos, term = cls._parse_term(text, pos, expression)
+                terms.append((sign * term[0], term[1], term[2]))
+
+            if pos == len(text):
+                break
+            if text[pos] not in "+-":
+                raise ValueError(f"unexpected '{text[pos]}' in '{expression}'")
+            sign = -1 if text[pos] == "-" else 1
+            pos += 1
+
+        return RollPlan(expression, tuple(terms), tuple(db_signs))
+
+    @classmethod
+    def _parse_term(cls, text: str, pos: int, expression: str) -> tuple:
+        pos, count = cls._parse_int(text, pos)
+        if pos >= len(text) or text[pos] != "d":
+            if count is None:
+                raise ValueError(f"expected a number or dice at {pos} in '{expression}'")
+            return pos, (count, 1, 0)
+
+        pos += 1
+        if count is None:
+            count = 1
+        if text.startswith("%", pos):
+            pos, sides = pos + 1, 100
+        else:
+            pos, sides = cls._parse_int(text, pos)
+        if not sides:
+            raise ValueError(f"missing number of sides in '{expression}'")
+
+        keep = 0
+        if text.startswith("k", pos):
+            direction = 1
+            pos += 1
+            if text.startswith("l", pos):
+                direction = -1
+                pos += 1
+            elif text.startswith("h", pos):
+                pos += 1
+            pos, keep = cls._parse_int(text, pos)
+            if keep is None or not 0 < keep <= count:
+                raise ValueError(f"invalid number of dice to keep in '{expression}'")
+            keep *= direction
+
+        return pos, (count, sides, keep)
+
+    @classmethod
+    def _parse_int(cls, text: str, pos: int) -> tuple:
+        start = pos
+        while pos < len(text) and text[pos].isdigit():
+            pos += 1
+        if pos == start:
+            return pos, None
+        return pos, int(text[start:pos])
 
 
 class Dice:
+    """
+    Dice pools rolled through a pluggable generator.
+
+    `rng` is anything with randint(a, b); the default is the "dice"
+    stream from rng.RNG. Use with_rng to bind a session's own stream,
+    behind a RollPool where something refills it, as the games do for
+    each investigator.
+    """
+
+    rng = RNG.stream("dice")
+
+    # pools of at least this many dice are drawn from a cached alias
+    # table in O(1), None always rolls every die
+    alias_threshold = 32
+    # pools whose totals span more outcomes than this use the normal
+    # approximation, see distribution.normal_error_bound for its error
+    max_alias_outcomes = 2048
+
+    # set to a roll_audit.RollAuditor to count every die face rolled
+    auditor = None
+
+    @classmethod
+    def with_rng(cls, rng):
+        """
+        Returns a subclass of this dice class that rolls with rng.
+
+        e.g.
+        dice = CthulhuDice.with_rng(RNG.stream("Ana Engel"))
+        dice.roll_skill(1, 0)
+        """
+        class BoundDice(cls):
+            pass
+
+        BoundDice.rng = rng
+        return BoundDice
+
+    @classmethod
+    def _np_generator(cls):
+        """ numpy generator seeded from rng so batches stay reproducible """
+        return np.random.default_rng(cls.rng.randint(0, 0xFFFFFFFF))
 
     @classmethod
     def roll(cls, num_dice: int, num_sides: int) -> int:
+        """
+        Rolls num_dice d num_sides.
+
+        A negative num_dice subtracts the dice, so constant terms such
+        as a damage bonus of (-2, 1) come out as -2.
+        """
+        if num_dice < 0:
+            return -cls.roll(-num_dice, num_sides)
+        if cls.alias_threshold is not None and num_dice >= cls.alias_threshold and num_sides > 1:
+            return cls.roll_large(num_dice, num_sides)
+        auditor = cls.auditor
+        if auditor is None:
+            # one call for the whole pool when the generator can, the
+            # per-die call otherwise costs more than drawing the die
+            roll_total = getattr(cls.rng, "roll_total", None)
+            if roll_total is not None:
+                return roll_total(num_dice, num_sides)
+        rand = cls.rng.randint
         result = 0
         for _ in range(num_dice):
-            result += randint(1, num_sides)
+            face = rand(1, num_sides)
+            if auditor is not None:
+                auditor.observe_die(num_sides, face)
+            result += face
         return result
 
+    @classmethod
+    def roll_large(cls, num_dice: int, num_sides: int) -> int:
+        """
+        Rolls a big pool like 200d6 without rolling every die.
+
+        Draws from an alias table of the exact distribution, or from
+        a rounded normal approximation when the table would be too big.
+        """
+        if num_dice * (num_sides - 1) + 1 > cls.max_alias_outcomes:
+            return cls.roll_normal(num_dice, num_sides)
+        return AliasCache.get(num_dice, num_sides).sample(cls.rng)
+
+    @classmethod
+    def roll_normal(cls, num_dice: int, num_sides: int) -> int:
+        """ Normal approximation of num_dice d num_sides, clamped to the possible totals """
+        mean = num_dice * (num_sides + 1) / 2
+        std_dev = sqrt(num_dice * (num_sides * num_sides - 1) / 12)
+        # Box-Muller, 1 - random() keeps log away from 0
+        z = sqrt(-2 * log(1 - cls.rng.random())) * cos(2 * pi * cls.rng.random())
+        total = int(mean + z * std_dev + 0.5)
+        return min(num_dice * num_sides, max(num_dice, total))
+
     @classmethod
     def roll_multiple(cls, dice: list[tuple]) -> int:
         """
@@ -33,13 +283,257 @@ class Dice:
         for die in dice:
             result += cls.roll(*die)
         return result
-    
+
+    @classmethod
+    def roll_batch(cls, num_dice: int, num_sides: int, trials: int):
+        """
+        Rolls num_dice d num_sides `trials` times in one call.
+
+        Meant for Monte Carlo workloads where calling roll() in a loop
+        is dominated by interpreter overhead.
+
+        :param: number of dice per trial
+        :param: number of sides per die
+        :param: number of trials
+        :return: numpy int32 array on the host, array('h') on the device.
+                 array('h') holds totals up to 32767.
+        """
+        if num_dice < 0:
+            results = cls.roll_batch(-num_dice, num_sides, trials)
+            if np is not None:
+                return -results
+            for t in range(trials):
+                results[t] = -results[t]
+            return results
+
+        results = _zeroed_results(trials)
+        if num_dice == 0 or trials <= 0:
+            return results
+
+        if np is not None:
+            generator = cls._np_generator()
+            rows = max(1, _BATCH_CHUNK // num_dice)
+            for start in range(0, trials, rows):
+                stop = min(trials, start + rows)
+                draws = generator.integers(
+                    1, num_sides + 1, size=(stop - start, num_dice), dtype=np.int32
+                )
+                draws.sum(axis=1, out=results[start:stop])
+            return results
+
+        if cls.alias_threshold is not None and num_dice >= cls.alias_threshold and num_sides > 1:
+            for t in range(trials):
+                results[t] = cls.roll_large(num_dice, num_sides)
+            return results
+
+        fill = getattr(cls.rng, "fill", None)
+        if fill is not None:
+            # one reusable buffer per batch instead of a call per die
+            scratch = array('h', (0 for _ in range(num_dice)))
+            for t in range(trials):
+                results[t] = sum(fill(scratch, num_sides))
+            return results
+
+        rand = cls.rng.randint  # local lookups are much cheaper on MicroPython
+        for t in range(trials):
+            total = 0
+            for _ in range(num_dice):
+                total += rand(1, num_sides)
+            results[t] = total
+        return results
+
+    @classmethod
+    def roll_multiple_batch(cls, dice: list[tuple], trials: int):
+        """
+        Batch version of roll_multiple.
+
+        :param: dice is a list of 2 element tuples (num_dice, num_sides)
+        :param: number of trials
+        :return: same array type as roll_batch, one total per trial
+        """
+        results = _zeroed_results(trials)
+        for die in dice:
+            rolled = cls.roll_batch(*die, trials)
+            if np is not None:
+                results += rolled
+            else:
+                for t in range(trials):
+                    results[t] += rolled[t]
+        return results
+
+    @classmethod
+    def roll_keep(cls, num_dice: int, num_sides: int, keep: int) -> int:
+        """
+        Rolls the dice and only sums some of them.
+
+        :param: keep > 0 keeps the highest dice, keep < 0 the lowest,
+                0 keeps every die
+        """
+        if keep == 0:
+            return cls.roll(num_dice, num_sides)
+        if num_dice < 0:
+            return -cls.roll_keep(-num_dice, num_sides, keep)
+
+        rand = cls.rng.randint
+        rolls = sorted(rand(1, num_sides) for _ in range(num_dice))
+        if cls.auditor is not None:
+            for face in rolls:
+                cls.auditor.observe_die(num_sides, face)
+        kept = rolls[-keep:] if keep > 0 else rolls[:-keep]
+        return sum(kept)
+
+    @classmethod
+    def roll_keep_batch(cls, num_dice: int, num_sides: int, keep: int, trials: int):
+        """ Batch version of roll_keep, returns the same array type as roll_batch """
+        if keep == 0:
+            return cls.roll_batch(num_dice, num_sides, trials)
+        if num_dice < 0:
+            results = cls.roll_keep_batch(-num_dice, num_sides, keep, trials)
+            if np is not None:
+                return -results
+            for t in range(trials):
+                results[t] = -results[t]
+            return results
+
+        results = _zeroed_results(trials)
+        if np is not None:
+            generator = cls._np_generator()
+            rows = max(1, _BATCH_CHUNK // num_dice)
+            for start in range(0, trials, rows):
+                stop = min(trials, start + rows)
+                draws = generator.integers(
+                    1, num_sides + 1, size=(stop - start, num_dice), dtype=np.int32
+                )
+                draws.sort(axis=1)
+                kept = draws[:, -keep:] if keep > 0 else draws[:, :-keep]
+                kept.sum(axis=1, out=results[start:stop])
+            return results
+
+        for t in range(trials):
+            results[t] = cls.roll_keep(num_dice, num_sides, keep)
+        return results
+
+    @classmethod
+    def roll_plan(cls, plan: RollPlan, db: tuple = (0, 0)) -> int:
+        result = 0
+        for num_dice, num_sides, keep in plan.terms_with(db):
+            result += cls.roll_keep(num_dice, num_sides, keep)
+        return result
+
+    @classmethod
+    def roll_plan_batch(cls, plan: RollPlan, trials: int, db: tuple = (0, 0)):
+        results = _zeroed_results(trials)
+        for num_dice, num_sides, keep in plan.terms_with(db):
+            rolled = cls.roll_keep_batch(num_dice, num_sides, keep, trials)
+            if np is not None:
+                results += rolled
+            else:
+                for t in range(trials):
+                    results[t] += rolled[t]
+        return results
+
+    @classmethod
+    def roll_expression(cls, expression: str, db: tuple = (0, 0)) -> int:
+        """
+        Rolls a dice string such as "1D10+1D4+2" or "2D6+DB".
+
+        :param: dice expression, see DiceExpression
+        :param: damage bonus tuple substituted for DB
+        """
+        return cls.roll_plan(DiceExpression.compile(expression), db)
+
+    @classmethod
+    def roll_expression_batch(cls, expression: str, trials: int, db: tuple = (0, 0)):
+        return cls.roll_plan_batch(DiceExpression.compile(expression), trials, db)
+
+
 class CthulhuDice(Dice):
+    """
+    Percentile dice with Call of Cthulhu bonus and penalty dice.
+
+    The 1 - 100 outcome table for each net modifier is computed once,
+    so rolling is a single lookup into a cumulative table and the
+    exact odds of every result level are available without simulating.
+    """
+
+    # A table for n net bonus/penalty dice counts 10 ** (n + 2) outcomes.
+    # Up to 7 that stays under MicroPython's 2 ** 30 small int limit on the
+    # Pico, so the draw and search never allocate; beyond it the dice are
+    # rolled directly.
+    MAX_TABLE_MODIFIER = 7
+
+    _skill_tables = {}
+
+    @classmethod
+    def skill_at_difficulty(cls, skill_val: int, level: str) -> int:
+        if level == "Hard":
+            return skill_val // 2
+        elif level == "Extreme":
+            return skill_val // 5
+        else:
+            return skill_val
+
+    @classmethod
+    def fumble_threshold(cls, skill_val: int) -> int:
+        return 100 if skill_val >= 50 else 96
+
+    @classmethod
+    def success_level(cls, roll: int, skill_val: int) -> int:
+        """
+        0 failure, 1 regular, 2 hard, 3 extreme, 4 critical success.
+        Fumbles count as failures here, see fumble_threshold.
+        """
+        if roll == 1:
+            return 4
+        if roll <= skill_val // 5:
+            return 3
+        if roll <= skill_val // 2:
+            return 2
+        if roll <= skill_val:
+            return 1
+        return 0
+
+    @classmethod
+    def skill_table(cls, bonus: int, penalty: int) -> tuple:
+        """
+        Outcome table for a d100 roll with the given modifiers.
+
+        :return: (total, counts, cumulative) where counts[i] is the number
+                 of ways out of total to roll i + 1
+        """
+        net = bonus - penalty
+        table = cls._skill_tables.get(net)
+        if table is None:
+            table = cls._build_skill_table(net)
+            cls._skill_tables[net] = table
+        return table
+
+    @classmethod
+    def _build_skill_table(cls, net: int) -> tuple:
+        num_tens = abs(net) + 1
+        counts = [0] * 100
+        for ones in range(10):
+            # every face a single tens die can produce with this ones die,
+            # from best to worst. 00 + 0 reads as 100.
+            faces = sorted((tens * 10 + ones) or 100 for tens in range(10))
+            for i, face in enumerate(faces):
+                if net >= 0:  # bonus dice keep the lowest result
+                    ways = (10 - i) ** num_tens - (9 - i) ** num_tens
+                else:  # penalty dice keep the highest
+                    ways = (i + 1) ** num_tens - i ** num_tens
+                counts[face - 1] += ways
+
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return running, tuple(counts), tuple(cumulative)
 
     @classmethod
-    def roll_skill(cls, bonus: int, penalty: int) -> int:  
+    def roll_skill(cls, bonus: int, penalty: int) -> int:
         """
-        Rolls a single ones digit die, along with n+1 tens dice 
+        Rolls a single ones digit die, along with n+1 tens dice
         where n is the abs(bonus - penalty)
 
         :param: number of bonus dice
@@ -47,17 +541,83 @@ class CthulhuDice(Dice):
         """
         modifier: int = abs(bonus - penalty)
         if modifier == 0:
-            return randint(1, 100)  
+            result = cls.rng.randint(1, 100)
+        elif modifier > cls.MAX_TABLE_MODIFIER:
+            result = cls._roll_skill_dice(bonus, penalty)
         else:
-            ones_digit = randint(0, 9)
-            tens_place = [randint(0, 9) * 10,]
-            for _ in range(modifier):
-                tens_place.append(randint(0, 9) * 10)
-
-            tens_place.sort()
-            tens_place = list(set(tens_place))
-            tens_digit = tens_place[0] if bonus > penalty else tens_place[-1]
-            
-            if (tens_digit + ones_digit) == 0:
-                return tens_place[1] if bonus > penalty else 100
-            return (tens_digit + ones_digit)
+            total, _, cumulative = cls.skill_table(bonus, penalty)
+            draw = cls.rng.randint(1, total)
+            lo, hi = 0, 99
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if cumulative[mid] >= draw:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            result = lo + 1
+
+        if cls.auditor is not None and modifier <= cls.MAX_TABLE_MODIFIER:
+            cls.auditor.observe_skill(bonus - penalty, result, cls.skill_table(bonus, penalty)[1])
+        return result
+
+    @classmethod
+    def _roll_skill_dice(cls, bonus: int, penalty: int) -> int:
+        """ Rolls every tens die, used for very large modifiers """
+        rand = cls.rng.randint
+        ones_digit = rand(0, 9)
+        results = []
+        for _ in range(abs(bonus - penalty) + 1):
+            results.append((rand(0, 9) * 10 + ones_digit) or 100)
+        return min(results) if bonus > penalty else max(results)
+
+    @classmethod
+    def odds(cls, skill: int, bonus: int = 0, penalty: int = 0) -> dict:
+        """
+        Exact probability of each result level for a skill roll.
+
+        Levels are exclusive and follow the game's result rules: a 1 is
+        critical, then extreme (skill // 5), hard (skill // 2) and
+        regular (skill) successes, then fumble or failure.
+
+        :param: skill value
+        :param: number of bonus dice
+        :param: number of penalty dice
+        :return: dict of level -> probability
+        """
+        total, counts, _ = cls.skill_table(bonus, penalty)
+        extreme = cls.skill_at_difficulty(skill, "Extreme")
+        hard = cls.skill_at_difficulty(skill, "Hard")
+        fumble = cls.fumble_threshold(skill)
+
+        ways = {
+            "critical": 0,
+            "extreme": 0,
+            "hard": 0,
+            "regular": 0,
+            "failure": 0,
+            "fumble": 0,
+        }
+        for roll in range(1, 101):
+            if roll == 1:
+                level = "critical"
+            elif roll <= extreme:
+                level = "extreme"
+            elif roll <= hard:
+                level = "hard"
+            elif roll <= skill:
+                level = "regular"
+            elif roll >= fumble:
+                level = "fumble"
+            else:
+                level = "failure"
+            ways[level] += counts[roll - 1]
+
+        return {level: count / total for level, count in ways.items()}
+
+    @classmethod
+    def success_chance(cls, skill: int, difficulty: str, bonus: int = 0, penalty: int = 0) -> float:
+        """ Probability of succeeding at the given difficulty or better """
+        # a roll of 1 always succeeds
+        target = max(1, min(100, cls.skill_at_difficulty(skill, difficulty)))
+        total, _, cumulative = cls.skill_table(bonus, penalty)
+        return cumulative[target - 1] / total
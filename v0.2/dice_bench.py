@@ -0,0 +1,268 @@
+"""
+Benchmark and statistical conformance suite for the dice.
+
+Reports rolls/sec for each rolling API and skill modifier, compares them
+against a stored baseline, and checks the rolls against their exact
+distributions with chi-square and Kolmogorov-Smirnov tests so a faster
+roller is shown to still be fair.
+
+usage:
+    python3 dice_bench.py                  run and compare with the baseline
+    python3 dice_bench.py --save-baseline  run and store the results as the baseline
+    python3 dice_bench.py --samples 50000  samples per fairness check
+    python3 dice_bench.py --tolerance 0.4  allowed slowdown before flagging, default 0.25
+
+Exits with 1 if anything regressed or failed a fairness check.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+import json
+import sys
+from math import exp, sqrt
+from dice import Dice, CthulhuDice
+from distribution import DistributionEngine, chi_square_p_value
+from rng import RNG, RollPool, Stream
+
+try:
+    from time import perf_counter as _now
+except ImportError:  # MicroPython
+    from time import ticks_us
+
+    def _now():
+        return ticks_us() / 1_000_000
+
+BASELINE_FILE = "dice_bench_baseline.json"
+# a benchmark is flagged when it is this much slower than its baseline
+REGRESSION_TOLERANCE = 0.25
+# fairness checks fail below this p-value
+SIGNIFICANCE = 0.001
+SKILL_MODIFIERS = [(0, 0), (1, 0), (2, 0), (0, 1), (0, 2)]
+
+
+def _benchmarks() -> list:
+    """ (name, callable, rolls per call) """
+    benches = [
+        ("Dice.roll 3d6", lambda: Dice.roll(3, 6), 1),
+        ("Dice.roll_multiple 1d10+1d4", lambda: Dice.roll_multiple([(1, 10), (1, 4)]), 1),
+        ("Dice.roll_batch 3d6 x1000", lambda: Dice.roll_batch(3, 6, 1000), 1000),
+        ("Dice.roll_expression 1D10+1D4+2", lambda: Dice.roll_expression("1D10+1D4+2"), 1),
+        ("Dice.roll 200d6", lambda: Dice.roll(200, 6), 1),
+    ]
+    for bonus, penalty in SKILL_MODIFIERS:
+        benches.append((
+            f"CthulhuDice.roll_skill +{bonus}/-{penalty}",
+            lambda b=bonus, p=penalty: CthulhuDice.roll_skill(b, p),
+            1,
+        ))
+    return benches
+
+
+def rolls_per_second(func, rolls_per_call: int, min_time: float = 0.2, repeats: int = 3) -> float:
+    """ Best of several timed runs, the best run is the least disturbed by noise """
+    best = 0.0
+    for _ in range(repeats):
+        calls = 0
+        start = _now()
+        elapsed = 0.0
+        while elapsed < min_time:
+            for _ in range(100):
+                func()
+            calls += 100
+            elapsed = _now() - start
+        best = max(best, calls * rolls_per_call / elapsed)
+    return best
+
+
+def run_benchmarks(baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> tuple:
+    """ :return: (results dict, list of regressed names) """
+    results = {}
+    regressions = []
+    for name, func, rolls in _benchmarks():
+        rate = rolls_per_second(func, rolls)
+        results[name] = rate
+        line = f"{name:<40} {rate:>14,.0f} rolls/s"
+        if name in baseline:
+            change = rate / baseline[name] - 1
+            line += f"  {change:+.1%} vs baseline"
+            if change < -tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return results, regressions
+
+
+def chi_square(observed: list, expected: list) -> tuple:
+    """
+    Pearson chi-square test. Neighbouring bins are merged until each
+    expects at least 5 counts.
+
+    :return: (statistic, degrees of freedom, p-value)
+    """
+    merged = []
+    obs_acc = exp_acc = 0
+    for o, e in zip(observed, expected):
+        obs_acc += o
+        exp_acc += e
+        if exp_acc >= 5:
+            merged.append((obs_acc, exp_acc))
+            obs_acc = exp_acc = 0
+    if exp_acc > 0 and merged:
+        o, e = merged.pop()
+        merged.append((o + obs_acc, e + exp_acc))
+
+    stat = sum((o - e) ** 2 / e for o, e in merged)
+    dof = len(merged) - 1
+    if dof < 1:
+        return stat, dof, 1.0
+    return stat, dof, chi_square_p_value(stat, dof)
+
+
+def ks_test(observed: list, cdf: list) -> tuple:
+    """
+    Kolmogorov-Smirnov test of counts against an exact CDF over the same
+    support. Conservative for discrete distributions.
+
+    :return: (D statistic, p-value)
+    """
+    n = sum(observed)
+    running = 0
+    d = 0.0
+    for count, expected in zip(observed, cdf):
+        running += count
+        d = max(d, abs(running / n - expected))
+
+    root_n = sqrt(n)
+    lam = (root_n + 0.12 + 0.11 / root_n) * d
+    if lam < 0.2:
+        return d, 1.0
+    p = 0.0
+    for k in range(1, 101):
+        p += 2 * (-1) ** (k - 1) * exp(-2 * k * k * lam * lam)
+    return d, min(1.0, max(0.0, p))
+
+
+def _fairness_cases(dice) -> list:
+    """ (name, sampler, outcomes, probabilities) """
+    cases = []
+    for label, terms in [("3d6", [(3, 6)]), ("1d10+1d4", [(1, 10), (1, 4)]), ("200d6", [(200, 6)])]:
+        dist = DistributionEngine.get(terms)
+        cases.append((
+            f"Dice.roll_multiple {label}",
+            lambda t=terms: dice.roll_multiple(t),
+            [v for v, _ in dist.items()],
+            [p for _, p in dist.items()],
+        ))
+    for bonus, penalty in SKILL_MODIFIERS:
+        total, counts, _ = dice.skill_table(bonus, penalty)
+        cases.append((
+            f"CthulhuDice.roll_skill +{bonus}/-{penalty}",
+            lambda b=bonus, p=penalty: dice.roll_skill(b, p),
+            list(range(1, 101)),
+            [c / total for c in counts],
+        ))
+        if bonus != penalty:
+            # rolling every tens die checks the tables themselves
+            cases.append((
+                f"CthulhuDice tens dice +{bonus}/-{penalty}",
+                lambda b=bonus, p=penalty: dice._roll_skill_dice(b, p),
+                list(range(1, 101)),
+                [c / total for c in counts],
+            ))
+    return cases
+
+
+def run_fairness(samples: int, seed: int = 1) -> list:
+    """ :return: list of names that failed """
+    # same pooled generator setup the game rolls with
+    dice = CthulhuDice.with_rng(RollPool(Stream(seed)))
+    failures = []
+    for name, sampler, outcomes, probs in _fairness_cases(dice):
+        index = {v: i for i, v in enumerate(outcomes)}
+        observed = [0] * len(outcomes)
+        for _ in range(samples):
+            observed[index[sampler()]] += 1
+
+        expected = [p * samples for p in probs]
+        cdf = []
+        running = 0.0
+        for p in probs:
+            running += p
+            cdf.append(running)
+
+        stat, dof, p_chi = chi_square(observed, expected)
+        d, p_ks = ks_test(observed, cdf)
+        ok = p_chi >= SIGNIFICANCE and p_ks >= SIGNIFICANCE
+        if not ok:
+            failures.append(name)
+        print(f"{name:<40} chi2={stat:8.1f} dof={dof:3d} p={p_chi:.3f}  "
+              f"KS D={d:.4f} p={p_ks:.3f}  {'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def run_reproducibility(master_seed: int = 1234, rolls: int = 200) -> list:
+    """
+    Checks one master seed replays the same rolls, pooled or not.
+
+    :return: list of names that failed
+    """
+    # pooled the way the games roll for an investigator
+    pooled = CthulhuDice.with_rng(RollPool(RNG.stream("bench investigator")))
+
+    def session() -> list:
+        RNG.seed_all(master_seed)
+        out = [Dice.roll(1, 6) for _ in range(rolls)]
+        out += [pooled.roll(3, 100) for _ in range(rolls)]
+        out += [pooled.roll_skill(1, 0) for _ in range(rolls)]
+        pooled.rng.refill()  # refills between sessions must not change what comes next
+        return out
+
+    failures = []
+    first = session()
+    ok = session() == first
+    if not ok:
+        failures.append("RNG.seed_all replay")
+    print(f"{'RNG.seed_all replay':<40} {'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def load_baseline(fpath: str = BASELINE_FILE) -> dict:
+    try:
+        with open(fpath, "r") as file:
+            return json.load(file)
+    except OSError:
+        return {}
+
+
+def save_baseline(results: dict, fpath: str = BASELINE_FILE):
+    with open(fpath, "w") as file:
+        json.dump(results, file)
+
+
+def main(argv: list) -> int:
+    samples = 20_000
+    if "--samples" in argv:
+        samples = int(argv[argv.index("--samples") + 1])
+    tolerance = REGRESSION_TOLERANCE
+    if "--tolerance" in argv:
+        tolerance = float(argv[argv.index("--tolerance") + 1])
+
+    print("----------- Throughput -----------")
+    results, regressions = run_benchmarks(load_baseline(), tolerance)
+    if "--save-baseline" in argv:
+        save_baseline(results)
+        print(f"baseline saved to {BASELINE_FILE}")
+
+    print("\n----------- Fairness -----------")
+    failures = run_fairness(samples)
+    failures += run_reproducibility()
+
+    if regressions or failures:
+        print(f"\n{len(regressions)} regression(s), {len(failures)} failed fairness check(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
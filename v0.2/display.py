@@ -0,0 +1,139 @@
+"""
+Schedules screens on the LCD so messages don't stall the game.
+
+A message that used to be shown with a sleep() after it is posted with
+a timeout instead, and the game carries on at once. The next screen
+posted waits for the message's time to run out, or for a key press,
+which cuts it short and is still read as the next key. Meanwhile the
+keypad's idle tasks keep running. If the game is waiting on a key when the time runs out, the screen the
+message covered is put back.
+
+    display.post("Result: 42\\nHard success!", 3500, keypad.default_layout)
+    display.post(menu)  # shows once the result has had its 3.5 sec
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from utime import ticks_ms, ticks_diff, ticks_add
+from kpc import PRESS
+
+# timeout for a screen that stays up until a key is pressed
+UNTIL_KEYPRESS = -1
+
+
+class DisplayScheduler:
+    def __init__(self, lcd, keypad):
+        self.lcd = lcd
+        self.keypad = keypad
+        self._deadline = None  # ticks_ms the timed screen runs out
+        self._until_keypress = False
+        self._on_expire = None
+        self._covered = None  # lcd.snapshot() of the screen under a timed one
+        self._settling = False
+
+    @property
+    def busy(self) -> bool:
+        """ True while a timed or until keypress screen is holding the LCD """
+        return self._deadline is not None or self._until_keypress
+
+    def post(self, text: str, timeout_ms: int = 0, on_expire=None):
+        """
+        Shows text once the screen before it is done.
+
+        :param: the whole screen, as for lcd.show()
+        :param: how long it holds the LCD, UNTIL_KEYPRESS, or 0 for a
+                screen the next one replaces straight away
+        :param: called when it runs out or is cut short
+        """
+        # a press cutting the last screen short would skip straight past a held one
+        self.settle(keep_press=not timeout_ms)
+        self._hold(timeout_ms, on_expire)
+        self.lcd.show(text)
+
+    async def post_async(self, text: str, timeout_ms: int = 0, on_expire=None):
+        """ post() for asyncio """
+        await self.settle_async(keep_press=not timeout_ms)
+        self._hold(timeout_ms, on_expire)
+        await self.lcd.show_async(text)
+
+    def settle(self, keep_press: bool = True):
+        """
+        Waits out the current screen, a key press cuts it short.
+
+        :param: leave the press queued for whoever reads the keypad next,
+                one that takes down an until keypress screen is always
+                used up, it was for that screen alone
+        """
+        self._settling = True
+        try:
+            while self.busy:
+                timeout = self._time_left()
+                if timeout == 0:
+                    break
+                event = self.keypad.get_event(timeout, consume=False)
+                if event is None:
+                    break
+                if event[0] != PRESS or not keep_press or self._until_keypress:
+                    self.keypad.get_event()
+                if event[0] == PRESS:
+                    break
+        finally:
+            self._settling = False
+        self._expire()
+
+    async def settle_async(self, keep_press: bool = True):
+        """ settle() for asyncio """
+        self._settling = True
+        try:
+            while self.busy:
+                timeout = self._time_left()
+                if timeout == 0:
+                    break
+                event = await self.keypad.wait_event(timeout, consume=False)
+                if event is None:
+                    break
+                if event[0] != PRESS or not keep_press or self._until_keypress:
+                    await self.keypad.wait_event()
+                if event[0] == PRESS:
+                    break
+        finally:
+            self._settling = False
+        self._expire()
+
+    def poll(self):
+        """ Keypad idle task, puts back the covered screen once a timed one runs out """
+        if self._settling or self._deadline is None or self._time_left() > 0:
+            return
+        self.dismiss()
+
+    def dismiss(self):
+        """ Ends the current screen's hold now, putting back the screen a timed one covered """
+        covered = self._covered
+        self._expire()
+        if covered is not None:
+            self.lcd.restore(covered)
+
+    def _hold(self, timeout_ms: int, on_expire):
+        if timeout_ms:
+            self._covered = self.lcd.snapshot()
+        if timeout_ms == UNTIL_KEYPRESS:
+            self._until_keypress = True
+        elif timeout_ms > 0:
+            self._deadline = ticks_add(ticks_ms(), timeout_ms)
+        self._on_expire = on_expire
+
+    def _time_left(self):
+        """ ms until the timed screen runs out, None for an until keypress screen """
+        if self._deadline is None:
+            return None
+        return max(0, ticks_diff(self._deadline, ticks_ms()))
+
+    def _expire(self):
+        on_expire = self._on_expire
+        self._deadline = None
+        self._until_keypress = False
+        self._on_expire = None
+        self._covered = None
+        if on_expire is not None:
+            on_expire()
@@ -0,0 +1,413 @@
+"""
+Exact probability distributions for dice expressions.
+
+Works on the same (num_dice, num_sides) tuple lists as Dice.roll_multiple
+so odds can be looked up instead of estimated by rolling thousands of times.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from array import array
+from math import exp, isfinite, log, pi
+from lru import LRUCache
+
+try:
+    from math import lgamma
+except ImportError:  # not in every MicroPython build
+    # Lanczos approximation, g = 7
+    _LANCZOS = (
+        0.99999999999980993, 676.5203681218851, -1259.1392167224028,
+        771.32342877765313, -176.61502916214059, 12.507343278686905,
+        -0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7,
+    )
+
+    def lgamma(x: float) -> float:
+        """ log(Gamma(x)) for x > 0 """
+        if x < 0.5:
+            return lgamma(x + 1) - log(x)
+        x -= 1
+        total = _LANCZOS[0]
+        for i in range(1, len(_LANCZOS)):
+            total += _LANCZOS[i] / (x + i)
+        t = x + 7.5
+        return 0.5 * log(2 * pi) + (x + 0.5) * log(t) - t + log(total)
+
+
+# Single precision floats on the RP2040 overflow past about 3.4e38, and
+# MicroPython converts both sides of a big int division to float first,
+# so counts are shifted below this before they are divided.
+_FLOAT_SAFE = 1 << 64
+
+
+def _shift_for(denominator: int) -> int:
+    """ Right shift that brings denominator under _FLOAT_SAFE """
+    shift = 0
+    while (denominator >> shift) > _FLOAT_SAFE:
+        shift += 16
+    return shift
+
+
+def _ratio(numerator: int, denominator: int) -> float:
+    """ numerator / denominator for big ints, without overflowing a float """
+    shift = _shift_for(denominator)
+    return (numerator >> shift) / (denominator >> shift)
+
+
+class Distribution:
+    """
+    Exact distribution of an integer valued dice total.
+
+    Outcomes are stored as integer counts starting at `offset`, so
+    the i-th count is the number of ways to roll `offset + i`.
+    """
+
+    def __init__(self, offset: int, counts: list[int]):
+        self.offset = offset
+        self.counts = tuple(counts)
+        self.total = sum(counts)
+
+        running = 0
+        cumulative = []
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        self._cumulative = tuple(cumulative)
+        shift = _shift_for(self.total)
+        total = self.total >> shift
+        self._pmf = tuple((count >> shift) / total for count in counts)
+        self._cdf = tuple((count >> shift) / total for count in cumulative)
+        for p in self._pmf:
+            if not isfinite(p):
+                raise ValueError("probability overflowed, counts are too large for a float")
+
+        weighted = 0
+        squared = 0
+        for i, count in enumerate(counts):
+            weighted += (offset + i) * count
+            squared += (offset + i) * (offset + i) * count
+        self.mean = _ratio(weighted, self.total)
+        # kept in integers until the final division to avoid cancellation
+        self.variance = _ratio(squared * self.total - weighted * weighted, self.total * self.total)
+
+    @property
+    def min(self) -> int:
+        return self.offset
+
+    @property
+    def max(self) -> int:
+        return self.offset + len(self.counts) - 1
+
+    @property
+    def std_dev(self) -> float:
+        return self.variance ** 0.5
+
+    def pmf(self, value: int) -> float:
+        """ P(X == value) """
+        i = value - self.offset
+        if 0 <= i < len(self._pmf):
+            return self._pmf[i]
+        return 0.0
+
+    def cdf(self, value: int) -> float:
+        """ P(X <= value) """
+        i = value - self.offset
+        if i < 0:
+            return 0.0
+        if i >= len(self._cdf):
+            return 1.0
+        return self._cdf[i]
+
+    def percentile(self, pct: float) -> int:
+        """
+        Smallest total whose cumulative probability reaches pct.
+
+        :param: pct in the range 0 - 100
+        """
+        if not 0 <= pct <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+
+        target = pct * self.total
+        lo, hi = 0, len(self._cumulative) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._cumulative[mid] * 100 >= target:
+                hi = mid
+            else:
+                lo = mid + 1
+        return self.offset + lo
+
+    def items(self):
+        """ Yields (total, probability) pairs in ascending order """
+        for i, p in enumerate(self._pmf):
+            yield self.offset + i, p
+
+    def convolve(self, other: "Distribution") -> "Distribution":
+        """ Distribution of the sum of two independent totals """
+        counts = [0] * (len(self.counts) + len(other.counts) - 1)
+        for i, a in enumerate(self.counts):
+            if a == 0:
+                continue
+            for j, b in enumerate(other.counts):
+                counts[i + j] += a * b
+        return Distribution(self.offset + other.offset, counts)
+
+
+def _add_dice(offset: int, counts: list[int], num_dice: int, num_sides: int):
+    """
+    Convolves num_dice uniform dice into counts one die at a time.
+
+    A sliding window sum keeps each die O(len(counts)) instead of
+    O(len(counts) * num_sides).
+    """
+    for _ in range(num_dice):
+        widened = []
+        window = 0
+        for i in range(len(counts) + num_sides - 1):
+            if i < len(counts):
+                window += counts[i]
+            if i >= num_sides:
+                window -= counts[i - num_sides]
+            widened.append(window)
+        counts = widened
+        offset += 1
+    return offset, counts
+
+
+class DistributionEngine:
+    """
+    Builds and caches exact distributions.
+
+    Terms follow the Dice conventions:
+        (n, s)  -> n dice with s sides
+        (n, 1)  -> the constant n, e.g. damage bonus (-2, 1)
+        (0, 0)  -> nothing, e.g. a damage bonus of 0
+        (-n, s) -> n dice with s sides are subtracted
+    """
+
+    _cache = LRUCache(32)
+
+    @classmethod
+    def normalize(cls, dice: list[tuple]) -> tuple:
+        """
+        Canonical cache key for a dice list.
+
+        Constants are folded into a single term and dice of the
+        same kind are merged, so 1d4 + 1d10 and 1d10 + 1d4 share an entry.
+        """
+        constant = 0
+        pools = {}  # (num_sides, sign) -> dice count, 1d6 - 1d6 must not cancel
+        for num_dice, num_sides in dice:
+            if num_dice == 0 or num_sides == 0:
+                continue
+            if num_sides < 0:
+                raise ValueError(f"invalid number of sides: {num_sides}")
+            if num_sides == 1:
+                constant += num_dice
+            else:
+                kind = (num_sides, num_dice > 0)
+                pools[kind] = pools.get(kind, 0) + num_dice
+
+        terms = [(n, kind[0]) for kind, n in sorted(pools.items())]
+        if constant:
+            terms.append((constant, 1))
+        return tuple(terms)
+
+    @classmethod
+    def get(cls, dice: list[tuple], cache: bool = True) -> Distribution:
+        """
+        Exact distribution for the sum of the given dice.
+
+        :param: dice is a list of 2 element tuples (num_dice, num_sides)
+        :param: keep a newly built distribution, False for one that is only
+                needed briefly, e.g. to build something smaller from
+        """
+        key = cls.normalize(dice)
+        dist = cls._cache.get(key)
+        if dist is None:
+            dist = cls._build(key)
+            if cache:
+                cls._cache.put(key, dist)
+        return dist
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def _build(cls, key: tuple) -> Distribution:
+        offset, counts = 0, [1]
+        negative = []
+        for num_dice, num_sides in key:
+            if num_sides == 1:
+                offset += num_dice
+            elif num_dice > 0:
+                offset, counts = _add_dice(offset, counts, num_dice, num_sides)
+            else:
+                negative.append((-num_dice, num_sides))
+
+        dist = Distribution(offset, counts)
+        for num_dice, num_sides in negative:
+            sub_offset, sub_counts = _add_dice(0, [1], num_dice, num_sides)
+            # -X has the mirrored counts of X
+            sub_counts.reverse()
+            dist = dist.convolve(Distribution(-(sub_offset + len(sub_counts) - 1), sub_counts))
+        return dist
+
+
+# Alias thresholds are fixed point out of 2 ** _ALIAS_BITS. 29 bits keeps
+# every threshold a small int on MicroPython; each outcome's probability
+# is off by at most 2 ** -29 from the exact value.
+_ALIAS_BITS = 29
+_ALIAS_ONE = 1 << _ALIAS_BITS
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table, draws from a Distribution in O(1).
+
+    A draw picks a column uniformly, then keeps it or takes its alias
+    depending on one more random number, however many outcomes there are.
+    The table is built from the integer counts, so no float is involved
+    however large the number of ways to roll gets.
+    """
+
+    def __init__(self, dist: Distribution):
+        n = len(dist.counts)
+        if n > 0xFFFF:
+            raise ValueError("too many outcomes for an alias table")
+        self.offset = dist.offset
+        self.size = n
+        self.threshold = array('i', (0 for _ in range(n)))
+        self.alias = array('H', (0 for _ in range(n)))
+
+        # each column holds dist.total ways to roll, shared with its alias
+        total = dist.total
+        scaled = [count * n for count in dist.counts]
+        small = [i for i in range(n) if scaled[i] < total]
+        large = [i for i in range(n) if scaled[i] >= total]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.threshold[s] = (scaled[s] << _ALIAS_BITS) // total
+            self.alias[s] = l
+            scaled[l] -= total - scaled[s]
+            if scaled[l] < total:
+                small.append(l)
+            else:
+                large.append(l)
+        # leftovers fill their column exactly
+        for i in small + large:
+            self.threshold[i] = _ALIAS_ONE
+            self.alias[i] = i
+
+    @property
+    def memory(self) -> int:
+        """ Bytes held by the table """
+        return self.size * 6  # 4 byte threshold + 2 byte alias
+
+    def sample(self, rng) -> int:
+        """ :param: generator with randint and getrandbits """
+        i = rng.randint(0, self.size - 1)
+        if rng.getrandbits(_ALIAS_BITS) < self.threshold[i]:
+            return self.offset + i
+        return self.offset + self.alias[i]
+
+
+class AliasCache:
+    """
+    Alias tables per (num_dice, num_sides), least recently used
+    tables are dropped once they hold more than 16 KB between them.
+
+    The big int distribution a table is built from is dropped straight
+    away, 200d6 alone holds over 100 KB of counts and probabilities,
+    so the tables' arrays are all the cache keeps.
+    """
+
+    _cache = LRUCache(16 * 1024, size_of=lambda table: table.memory)
+
+    @classmethod
+    def get(cls, num_dice: int, num_sides: int) -> AliasTable:
+        key = (num_dice, num_sides)
+        table = cls._cache.get(key)
+        if table is None:
+            table = AliasTable(DistributionEngine.get([key], cache=False))
+            cls._cache.put(key, table)
+        return table
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+
+# Berry-Esseen constant (Shevtsova, 2011)
+_BERRY_ESSEEN = 0.4748
+
+
+def normal_error_bound(num_dice: int, num_sides: int) -> float:
+    """
+    Worst case gap between the CDF of num_dice d num_sides and its
+    normal approximation, from the Berry-Esseen theorem:
+
+        sup |F(x) - Phi(x)| <= C * rho / (sigma ** 3 * sqrt(num_dice))
+
+    where sigma ** 2 and rho are the variance and third absolute central
+    moment of one die. For d6 this is about 0.61 / sqrt(num_dice),
+    i.e. under 0.02 (2 percentage points) at 1000 dice. In practice the
+    rounded approximation does considerably better than the bound.
+    """
+    mean = (num_sides + 1) / 2
+    variance = (num_sides * num_sides - 1) / 12
+    rho = sum(abs(face - mean) ** 3 for face in range(1, num_sides + 1)) / num_sides
+    return _BERRY_ESSEEN * rho / (variance ** 1.5 * num_dice ** 0.5)
+
+
+# Both _upper_gamma loops stop once a step changes the result by less than
+# _GAMMA_EPS, a few single precision ulps so they settle on the RP2040
+# as well, or after _GAMMA_MAX_ITER steps at the latest.
+_GAMMA_EPS = 1e-6
+_GAMMA_MAX_ITER = 200
+# stands in for 0 in the continued fraction, still above float32's smallest normal
+_GAMMA_TINY = 1e-30
+
+
+def _upper_gamma(a: float, x: float) -> float:
+    """ Regularized upper incomplete gamma Q(a, x) """
+    if x <= 0:
+        return 1.0
+    front = exp(-x + a * log(x) - lgamma(a))
+    if x < a + 1:  # series for P(a, x)
+        term = total = 1 / a
+        n = a
+        for _ in range(_GAMMA_MAX_ITER):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) <= abs(total) * _GAMMA_EPS:
+                break
+        return max(0.0, 1 - front * total)
+    # continued fraction for Q(a, x), modified Lentz
+    b = x + 1 - a
+    c = 1 / _GAMMA_TINY
+    d = 1 / b
+    h = d
+    for i in range(1, _GAMMA_MAX_ITER + 1):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = _GAMMA_TINY if abs(d) < _GAMMA_TINY else d
+        c = b + an / c
+        c = _GAMMA_TINY if abs(c) < _GAMMA_TINY else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < _GAMMA_EPS:
+            break
+    return front * h
+
+
+def chi_square_p_value(stat: float, dof: int) -> float:
+    """ P(chi-square with dof degrees of freedom >= stat) """
+    if dof < 1:
+        return 1.0
+    return _upper_gamma(dof / 2, stat / 2)
@@ -2,11 +2,11 @@
 This module defines the game logic
 """
 
-from time import sleep
 from character_sheet import CthulhuCharacter, PulpCharacter
+from display import DisplayScheduler, UNTIL_KEYPRESS
 from kpc import KeypadController, Color
 from I2C_LCD import I2cLcd
-import json
+from sheet_journal import WriteBehind
 
 
 class Game:
@@ -16,9 +16,14 @@ class Game:
     Game acts as an Interface
     """
 
+    # coalesces sheet changes from every game, flushed by main.power_off
+    write_behind = WriteBehind()
+
     def __init__(self, keypad: KeypadController, lcd: I2cLcd):
         self.keypad = keypad
         self.lcd = lcd
+        # messages hold the LCD for a while without stalling the game
+        self.display = DisplayScheduler(lcd, keypad)
         self.game_menu = {}
         self.running = True
 
@@ -26,6 +31,7 @@ class Game:
         raise NotImplementedError
 
     def reset_lcd(self):
+        self.display.settle()
         self.lcd.clear()
         self.lcd.blink_cursor_off()
 
@@ -48,25 +54,20 @@ class Game:
         Helper method for print short lists to the user.
         """
         self.reset_lcd()
-        i = 0
-        keypress = -1
-        for option in options:
-            self.lcd.putstr(f"{i}: {option} \n")
-            i += 1
+        self.lcd.putstr(self._options_screen(options))
 
         keypress = self.keypad.get_button_press()
-        while keypress >= i:
-            self.reset_lcd()
-            self.lcd.putstr("Press a valid key. \n")
-            sleep(1.5)
-            self.reset_lcd()
-
-            for j in range(options):
-                self.lcd.putstr(f"{j}: {options[j]} \n")
+        while keypress >= len(options):
+            self.display.post("Press a valid key. \n", 1500)
+            self.display.post(self._options_screen(options))
             keypress = self.keypad.get_button_press()
 
         return keypress
 
+    def _options_screen(self, options: list[str]) -> str:
+        """ Numbered options, one per line """
+        return "".join(f"{i}: {options[i]} \n" for i in range(len(options)))
+
     def select_from_list_menu(self, list_of_stuff: list[str]) -> str:
         """
         Helper method for printing lists of things
@@ -76,57 +77,69 @@ class Game:
         which is then passed into another method to get a value.
         :return: str
         """
+        return list_of_stuff[self.select_index_from_list(list_of_stuff)].lstrip()
+
+    def select_index_from_list(self, list_of_stuff: list[str]) -> int:
+        """ select_from_list_menu, but the index of the chosen line is returned """
         keypress = 0
         self.lcd.hide_cursor()
         current = 0
         cursor_index = 0
         max_len = len(list_of_stuff)
-        num_lines = self.lcd.num_lines
 
         while keypress != self.keypad.ACCEPT:
-            for i in range(min(self.lcd.num_lines, max_len)):
-                if i == cursor_index:
-                    msg = ">:"
-                else:
-                    msg = "  "
-
-                msg += list_of_stuff[current + i] + "\n"
-                self.lcd.putstr(msg)
+            # only the moved cursor and any changed names go out over I2C
+            self.display.post(self._list_screen(list_of_stuff, current, cursor_index))
 
             keypress = self.keypad.get_button_press()
+            current, cursor_index = self._scroll(keypress, current, cursor_index, max_len)
 
-            # Figure out how far down does the user want to scroll
-            if keypress == self.keypad.UP_MENU:
-                cursor_index -= 1
+        return cursor_index + current
 
-            elif keypress == self.keypad.DOWN_MENU:
-                cursor_index += 1
+    def _list_screen(self, list_of_stuff: list[str], current: int, cursor_index: int) -> str:
+        """ The page of the list starting at current, with the cursor on its line """
+        screen = ""
+        for i in range(min(self.lcd.num_lines, len(list_of_stuff))):
+            if i == cursor_index:
+                screen += ">:"
+            else:
+                screen += "  "
 
-            elif keypress == self.keypad.PAGE_UP:
-                cursor_index -= num_lines
+            screen += list_of_stuff[current + i] + "\n"
+        return screen
 
-            elif keypress == self.keypad.PAGE_DOWN:
-                cursor_index += num_lines
+    def _scroll(self, keypress: int, current: int, cursor_index: int, max_len: int) -> tuple:
+        """ :return: (current, cursor_index) after moving through the list for a key """
+        num_lines = min(self.lcd.num_lines, max_len)
+        selected = current + cursor_index
 
-            # If they reach the bounds of the screen
-            if cursor_index >= num_lines:
-                cursor_index = 0  # TODO we may want to set to num_lines - 1
-                current += num_lines - 1
-                self.lcd.clear()
+        # Figure out how far down does the user want to scroll
+        if keypress == self.keypad.UP_MENU:
+            selected -= 1
 
-            elif cursor_index < 0:
-                cursor_index = (
-                    num_lines - 1
-                )  # and this to 0 depending on desired behavior
-                current -= num_lines - 1
-                self.lcd.clear()
+        elif keypress == self.keypad.DOWN_MENU:
+            selected += 1
 
-            if (current + (num_lines - 1)) >= max_len or current < 0:
-                current = 0
+        elif keypress == self.keypad.PAGE_UP:
+            selected -= num_lines
 
-            sleep(0.1)
+        elif keypress == self.keypad.PAGE_DOWN:
+            selected += num_lines
 
-        return list_of_stuff[cursor_index + current].lstrip()
+        else:
+            return current, cursor_index
+
+        # past either end wraps around to the other
+        selected %= max_len
+
+        # scroll only as far as it takes to keep the selection on screen,
+        # so every line is reachable however long the list is
+        if selected < current:
+            current = selected
+        elif selected >= current + num_lines:
+            current = selected - num_lines + 1
+
+        return current, selected - current
 
     def get_number(self):
         """
@@ -134,55 +147,61 @@ class Game:
         blocking function.
         :return: int from user input
         """
-        test_str = ""
+        entry = ["", True, ""]  # digits so far, first digit, last digit
         keypress = None
         self.lcd.blink_cursor_on()
-        first = True
-        prev_press = -1
 
         while keypress != self.keypad.ACCEPT:
             keypress = self.keypad.get_button_press()
+            self._number_key(keypress, entry)
 
-            if 0 <= keypress <= 9:
-                usr_in = str(keypress)
-                self.lcd.putchar(usr_in)
-                test_str += usr_in
-                if first:
-                    self.keypad.light_button(keypress, Color.pink)
-                    first = False
-                else:
-                    self.keypad.light_button(keypress, Color.blue)
-                prev_press = keypress
-
-            if keypress == self.keypad.BACKSPACE:
-                if first:
-                    self.keypad.light_button(int(test_str), Color.black)
-                else:
-                    # We are bounded to 16 Python!!!
-                    self.keypad.light_button(int(usr_in), Color.black)
-                    first = True
-
-                test_str = test_str[:-1]
-                if self.lcd.cursor_x > 7:  # TODO: we may need to change this
-                    self.lcd.cursor_x -= 1
-                    self.lcd.move_to(self.lcd.cursor_x, self.lcd.cursor_y)
-                    self.lcd.putchar(" ")
-                    self.lcd.cursor_x -= 1
-                    self.lcd.move_to(self.lcd.cursor_x, self.lcd.cursor_y)
-
+        test_str = entry[0]
         self.lcd.blink_cursor_off()
         self.keypad.reset_number_buttons()
         return int(test_str) if test_str != "" else 0
 
+    def _number_key(self, keypress: int, entry: list):
+        """ Echoes a digit or backspace from get_number and updates entry """
+        test_str, first, usr_in = entry
+
+        if 0 <= keypress <= 9:
+            usr_in = str(keypress)
+            self.lcd.putchar(usr_in)
+            test_str += usr_in
+            if first:
+                self.keypad.light_button(keypress, Color.pink)
+                first = False
+            else:
+                self.keypad.light_button(keypress, Color.blue)
+
+        if keypress == self.keypad.BACKSPACE:
+            if first:
+                self.keypad.light_button(int(test_str), Color.black)
+            else:
+                # We are bounded to 16 Python!!!
+                self.keypad.light_button(int(usr_in), Color.black)
+                first = True
+
+            test_str = test_str[:-1]
+            if self.lcd.cursor_x > 7:  # TODO: we may need to change this
+                self.lcd.cursor_x -= 1
+                self.lcd.move_to(self.lcd.cursor_x, self.lcd.cursor_y)
+                self.lcd.putchar(" ")
+                self.lcd.cursor_x -= 1
+                self.lcd.move_to(self.lcd.cursor_x, self.lcd.cursor_y)
+
+        entry[:] = [test_str, first, usr_in]
+
     def get_yes_no(self):
         """
         gets a yes or no answer from the user via keypad entry.
         blocking function.
         """
-        keypress = 0
         self.lcd.hide_cursor()
-        while keypress != self.keypad.ACCEPT and keypress != self.keypad.BACKSPACE:
+        while True:
             keypress = self.keypad.get_button_press()
+            # an answer takes down the message below and brings the question back
+            self.display.dismiss()
 
             if keypress == self.keypad.ACCEPT:
                 return True
@@ -191,9 +210,7 @@ class Game:
                 return False
 
             else:
-                self.lcd.putstr("Press a valid key")
-                sleep(1.5)
-                self.lcd.clear()
+                self.display.post("Press a valid key", 1500)
 
 
 class CthulhuGame(Game):
@@ -203,9 +220,20 @@ class CthulhuGame(Game):
 
     """
 
-    def __init__(self, keypad: KeypadController, lcd: I2cLcd, fpath: str):
+    # pre-rolled values generated per idle poll of the keypad
+    dice_refill_budget = 8
+    character_class = CthulhuCharacter
+
+    def __init__(self, keypad: KeypadController, lcd: I2cLcd, investigator):
+        """
+        :param: keypad
+        :param: lcd
+        :param: a loaded character, e.g. from the Roster, or a sheet file path
+        """
         super().__init__(keypad, lcd)
-        self.investigator = CthulhuCharacter(fpath)
+        if isinstance(investigator, str):
+            investigator = self.character_class(investigator, lazy=True, journal=True)
+        self.investigator = investigator
         self.difficulty_levels = ["Normal", "Hard", "Extreme"]
         self.populate_game_menu()
 
@@ -217,6 +245,7 @@ class CthulhuGame(Game):
             "Quit": self.quit,
             "Select Weapon": self.select_weapon,
             "Roll Damage": self.roll_damage,
+            "Dice Fairness": self.view_dice_audit,
         }
 
     def loop(self):
@@ -224,15 +253,50 @@ class CthulhuGame(Game):
         for k, v in self.game_menu.items():
             options.append(k)
 
+        self._start()
         self.reset_lcd()
-        while self.running:
-            selected = self.select_from_list_menu(options)
-            self.reset_lcd()
-            self.game_menu[selected]()
+        try:
+            while self.running:
+                selected = self.select_from_list_menu(options)
+                self.reset_lcd()
+                self.game_menu[selected]()
+        finally:
+            self._finish()
+
+    def _start(self):
+        # top up the investigator's pre-rolled dice and write out held
+        # back sheet changes while waiting on keys
+        self._idle_tasks = (self.refill_dice, self.poll_changes, self.display.poll)
+        self.write_behind.track(self.investigator)
+        for task in self._idle_tasks:
+            self.keypad.add_idle_task(task)
+
+    def _finish(self):
+        for task in self._idle_tasks:
+            self.keypad.remove_idle_task(task)
+        self.display.dismiss()
+        self.write_behind.untrack(self.investigator)
+
+    def refill_dice(self):
+        self.investigator.rng.refill(self.dice_refill_budget)
+
+    def poll_changes(self):
+        self.write_behind.poll()
 
     def determine_result(
         self, roll: int, skill_val: int, fumble: int, difficulty: str
     ) -> bool:
+        msg, failed = self._grade(roll, skill_val, fumble, difficulty)
+        # up for 3.5 sec or until a key, the game carries on meanwhile
+        self.display.post("Result: " + str(roll) + "\n" + msg, 3500, self.keypad.default_layout)
+        return failed
+
+    def _grade(self, roll: int, skill_val: int, fumble: int, difficulty: str) -> tuple:
+        """
+        Lights the keypad for the result of a roll.
+
+        :return: (message, whether the roll failed)
+        """
         msg = ""
         failed = False
         if roll == 1:
@@ -261,17 +325,13 @@ class CthulhuGame(Game):
             self.keypad.light_buttons(16, Color.red)
             failed = True
 
-        self.lcd.putstr("Result: " + str(roll) + "\n" + msg)
-        sleep(3.5)
-        self.keypad.default_layout()
-        self.reset_lcd()
-        return failed
+        return msg, failed
 
     def make_skill_roll(self):
         skill = self.select_from_list_menu(self.investigator.skills)
         diff_level = self.select_option(self.difficulty_levels)
 
-        val = self.investigator.get_value_at(skill)
+        val = self.investigator.get_value_at(skill, "Skills")
         if isinstance(val, int):
             self.reset_lcd()
             self.lcd.putstr("Any modifiers?\n")
@@ -298,7 +358,7 @@ class CthulhuGame(Game):
                 roll, skill_val_at, fumble, self.difficulty_levels[diff_level]
             )
             if failed and roll < fumble:
-                self.lcd.putstr("Push the roll? \n")
+                self.display.post("Push the roll? \n")
                 push = self.get_yes_no()
 
                 if push:
@@ -308,9 +368,7 @@ class CthulhuGame(Game):
                         roll, skill_val_at, fumble, self.difficulty_levels[diff_level]
                     )
                     if failed_push:
-                        self.lcd.putstr("Failing pushed\nrolls is bad!")
-                        sleep(2)
-                        self.reset_lcd()
+                        self.display.post("Failing pushed\nrolls is bad!", 2000)
 
         else:
             raise TypeError("Selected Skill does not have a value associated with it.")
@@ -335,27 +393,48 @@ class CthulhuGame(Game):
 
         self.investigator.change_sanity(amt)
 
-    def roll_damage(self):  # TODO: Create means to grab damage die from weapon
-        self.lcd.putstr("Rolling Damage\n")
-        damage = self.investigator.roll_damage((1, 6))
-        sleep(1.5)
+    def roll_damage(self):
+        if not self.investigator.current_weapon:
+            self.select_weapon()
+
+        try:
+            damage = self.investigator.roll_weapon_damage()
+        except ValueError:
+            self.display.post("No damage listed\nfor this weapon.", 1500)
+            return
+        self.display.post("Rolling Damage\n", 1500)
+        self.display.post(f"You deal {damage} damage", UNTIL_KEYPRESS)
+
+    def view_dice_audit(self):
+        auditor = self.investigator.dice.auditor
+        if auditor is None:
+            self.display.post("Dice audit is off.", 1500)
+            return
+
+        lines = auditor.lcd_lines() or ["No rolls yet."]
+        # the last line of each page is kept for the prompt
+        page_len = self.lcd.num_lines - 1
+        for start in range(0, len(lines), page_len):
+            self.reset_lcd()
+            for line in lines[start:start + page_len]:
+                self.lcd.putstr(line[:self.lcd.num_columns] + "\n")
+            self.lcd.putstr("Press any key")
+            self.keypad.get_button_press()
         self.reset_lcd()
-        self.lcd.putstr(f"You deal {damage} damage")
 
     def select_weapon(self):
         # For displaying selection back to the user
         selection = 1 + self.select_option(self.investigator.get_weapon_names())
         self.investigator.set_current_weapon(selection)
         name = self.investigator.current_weapon["Name"]
-        self.lcd.putstr(f"you selected {name}\n")
-        sleep(2.5)
-        self.reset_lcd()
+        self.display.post(f"you selected {name}\n", 2500)
 
 
 class PulpCthulhuGame(CthulhuGame):
-    def __init__(self, keypad: KeypadController, lcd: I2cLcd, fpath: str):
-        super().__init__(keypad, lcd, fpath)
-        self.investigator = PulpCharacter(fpath)  # FIXME: Don't make me twice!
+    character_class = PulpCharacter
+
+    def __init__(self, keypad: KeypadController, lcd: I2cLcd, investigator):
+        super().__init__(keypad, lcd, investigator)
         self.game_menu["Change Luck"] = self.change_luck_points
         self.game_menu["View Pulp Talents"] = self.view_pulp_talents
         self.game_menu["Save Changes"] = self.save_changes
@@ -375,14 +454,13 @@ class PulpCthulhuGame(CthulhuGame):
         self.reset_lcd()
         desc = self.select_from_list_menu(self.investigator.talents)
         self.reset_lcd()
-        self.lcd.putstr(self.investigator.get_value_at(desc))
+        self.lcd.putstr(self.investigator.get_value_at(desc, "Pulp Talents"))
         self.get_yes_no()
         self.reset_lcd()
 
     def save_changes(self):
-        filename = self.investigator.name.strip(" ") + "_pulp_cthulhu.json"
-        with open(filename, "w") as file:
-            json.dump(file)
+        self.investigator.compact()
+        self.display.post("Changes saved.\n", 1500)
 
 
 s_game = {"Call of Cthulhu": CthulhuGame}
@@ -0,0 +1,249 @@
+"""
+asyncio versions of the games.
+
+Every wait, on a key, the LCD or a message's time on screen, is awaited,
+so the keypad/LCD UI shares one event loop with the web API and the LED
+blink on a Pico W instead of blocking it. The menus and rules are the
+ones in game.py, only how they wait differs. Every method of the sync
+games that waits is overridden here, so none of them can stall the loop.
+
+Compacting a journal rewrites the whole sheet, so while the game runs
+changes are only appended to the journal, and compaction waits until
+the game is left.
+
+    game = GameFactory.create_game(keypad, lcd, roster, "Pulp Cthulhu", use_async=True)
+    await game.loop()
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from character_sheet import PulpCharacter
+from display import UNTIL_KEYPRESS
+from game import CthulhuGame
+
+
+class AsyncCthulhuGame(CthulhuGame):
+    """
+    CthulhuGame for asyncio. The menu handlers are coroutines, so
+    game_menu values are awaited by loop().
+    """
+
+    async def loop(self):
+        options = []
+        for k, v in self.game_menu.items():
+            options.append(k)
+
+        self._start()
+        await self.clear_screen()
+        try:
+            while self.running:
+                selected = await self.select_from_list_menu(options)
+                await self.clear_screen()
+                result = self.game_menu[selected]()
+                if result is not None:  # quit() is a plain method
+                    await result
+        finally:
+            self._finish()
+
+    async def clear_screen(self):
+        """ reset_lcd() without the clear command's 5 msec stall """
+        self.lcd.blink_cursor_off()
+        await self.display.post_async("")
+
+    async def reset_lcd(self):
+        await self.clear_screen()
+
+    def poll_changes(self):
+        self.write_behind.poll(compact=False)
+
+    async def select_option(self, options: list[str]) -> int:
+        await self.display.post_async(self._options_screen(options))
+
+        keypress = await self.keypad.wait_button_press()
+        while keypress >= len(options):
+            await self.display.post_async("Press a valid key. \n", 1500)
+            await self.display.post_async(self._options_screen(options))
+            keypress = await self.keypad.wait_button_press()
+
+        return keypress
+
+    async def select_from_list_menu(self, list_of_stuff: list[str]) -> str:
+        return list_of_stuff[await self.select_index_from_list(list_of_stuff)].lstrip()
+
+    async def select_index_from_list(self, list_of_stuff: list[str]) -> int:
+        keypress = 0
+        self.lcd.hide_cursor()
+        current = 0
+        cursor_index = 0
+        max_len = len(list_of_stuff)
+
+        while keypress != self.keypad.ACCEPT:
+            await self.display.post_async(self._list_screen(list_of_stuff, current, cursor_index))
+            keypress = await self.keypad.wait_button_press()
+            current, cursor_index = self._scroll(keypress, current, cursor_index, max_len)
+
+        return cursor_index + current
+
+    async def get_number(self):
+        entry = ["", True, ""]  # digits so far, first digit, last digit
+        keypress = None
+        self.lcd.blink_cursor_on()
+
+        while keypress != self.keypad.ACCEPT:
+            keypress = await self.keypad.wait_button_press()
+            self._number_key(keypress, entry)
+
+        self.lcd.blink_cursor_off()
+        self.keypad.reset_number_buttons()
+        return int(entry[0]) if entry[0] != "" else 0
+
+    async def get_yes_no(self):
+        self.lcd.hide_cursor()
+        while True:
+            keypress = await self.keypad.wait_button_press()
+            # an answer takes down the message below and brings the question back
+            self.display.dismiss()
+
+            if keypress == self.keypad.ACCEPT:
+                return True
+
+            elif keypress == self.keypad.BACKSPACE:
+                return False
+
+            await self.display.post_async("Press a valid key", 1500)
+
+    async def determine_result(
+        self, roll: int, skill_val: int, fumble: int, difficulty: str
+    ) -> bool:
+        msg, failed = self._grade(roll, skill_val, fumble, difficulty)
+        # up for 3.5 sec or until a key, the game carries on meanwhile
+        await self.display.post_async("Result: " + str(roll) + "\n" + msg, 3500, self.keypad.default_layout)
+        return failed
+
+    async def make_skill_roll(self):
+        skill = await self.select_from_list_menu(self.investigator.skills)
+        diff_level = await self.select_option(self.difficulty_levels)
+        difficulty = self.difficulty_levels[diff_level]
+
+        val = self.investigator.get_value_at(skill, "Skills")
+        if not isinstance(val, int):
+            raise TypeError("Selected Skill does not have a value associated with it.")
+
+        await self.display.post_async("Any modifiers?\n")
+        if await self.get_yes_no():
+            await self.display.post_async("Num of bonus \ndice:")
+            bonus = await self.get_number()
+            await self.display.post_async("Num of penalty \ndice:")
+            penalty = await self.get_number()
+        else:
+            bonus = 0
+            penalty = 0
+
+        await self.clear_screen()
+
+        roll = self.investigator.roll_skill(bonus, penalty)
+        skill_val_at = self.investigator.get_skill_at_difficulty(val, difficulty)
+        fumble = self.investigator.get_fumble(val)
+        failed = await self.determine_result(roll, skill_val_at, fumble, difficulty)
+        if failed and roll < fumble:
+            await self.display.post_async("Push the roll? \n")
+            if await self.get_yes_no():
+                await self.clear_screen()
+                roll = self.investigator.roll_skill(bonus, penalty)
+                failed_push = await self.determine_result(roll, skill_val_at, fumble, difficulty)
+                if failed_push:
+                    await self.display.post_async("Failing pushed\nrolls is bad!", 2000)
+
+    async def change_hit_points(self):
+        await self.display.post_async("Taking Damage?\n")
+        damaged = await self.get_yes_no()
+        amt = await self.get_number()
+        if damaged:
+            amt = -amt
+
+        self.investigator.change_hit_points(amt)
+
+    async def change_sanity(self):
+        await self.display.post_async("Losing Sanity?\n")
+        answer = await self.get_yes_no()
+        await self.display.post_async("How much damage? \n")
+        amt = await self.get_number()
+        if answer:
+            amt = -amt
+
+        self.investigator.change_sanity(amt)
+
+    async def roll_damage(self):
+        if not self.investigator.current_weapon:
+            await self.select_weapon()
+
+        try:
+            damage = self.investigator.roll_weapon_damage()
+        except ValueError:
+            await self.display.post_async("No damage listed\nfor this weapon.", 1500)
+            return
+        await self.display.post_async("Rolling Damage\n", 1500)
+        await self.display.post_async(f"You deal {damage} damage", UNTIL_KEYPRESS)
+
+    async def view_dice_audit(self):
+        auditor = self.investigator.dice.auditor
+        if auditor is None:
+            await self.display.post_async("Dice audit is off.", 1500)
+            return
+
+        lines = auditor.lcd_lines() or ["No rolls yet."]
+        # the last line of each page is kept for the prompt
+        page_len = self.lcd.num_lines - 1
+        for start in range(0, len(lines), page_len):
+            page = "".join(line[:self.lcd.num_columns] + "\n" for line in lines[start:start + page_len])
+            await self.display.post_async(page + "Press any key")
+            await self.keypad.wait_button_press()
+        await self.clear_screen()
+
+    async def select_weapon(self):
+        # For displaying selection back to the user
+        selection = 1 + await self.select_option(self.investigator.get_weapon_names())
+        self.investigator.set_current_weapon(selection)
+        name = self.investigator.current_weapon["Name"]
+        await self.display.post_async(f"you selected {name}\n", 2500)
+
+
+class AsyncPulpCthulhuGame(AsyncCthulhuGame):
+    character_class = PulpCharacter
+    # set by Save Changes, the sheet is rewritten once the game is left
+    _save_on_finish = False
+
+    def __init__(self, keypad, lcd, investigator):
+        super().__init__(keypad, lcd, investigator)
+        self.game_menu["Change Luck"] = self.change_luck_points
+        self.game_menu["View Pulp Talents"] = self.view_pulp_talents
+        self.game_menu["Save Changes"] = self.save_changes
+
+    async def change_luck_points(self):
+        await self.display.post_async("Spending Luck?\n")
+        answer = await self.get_yes_no()
+        await self.display.post_async("How much luck?\n")
+        amt = await self.get_number()
+        if answer:
+            amt = -amt
+
+        self.investigator.change_luck(amt)
+
+    async def view_pulp_talents(self):
+        desc = await self.select_from_list_menu(self.investigator.talents)
+        await self.display.post_async(self.investigator.get_value_at(desc, "Pulp Talents"))
+        await self.get_yes_no()
+        await self.clear_screen()
+
+    async def save_changes(self):
+        # journaled now, the sheet itself is rewritten when the game is left
+        self.write_behind.flush(compact=False)
+        self._save_on_finish = True
+        await self.display.post_async("Changes saved.\n", 1500)
+
+    def _finish(self):
+        super()._finish()
+        if self._save_on_finish:
+            self.investigator.compact()
+            self._save_on_finish = False
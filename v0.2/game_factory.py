@@ -1,6 +1,7 @@
 from kpc import KeypadController
 from I2C_LCD import I2cLcd
 from game import Game, CthulhuGame, PulpCthulhuGame
+from game_async import AsyncCthulhuGame, AsyncPulpCthulhuGame
 
 supported_games = [
     "Call of Cthulhu",
@@ -8,26 +9,34 @@ supported_games = [
 ]
 
 
-def get_game(selected_game: str) -> Game:
+def get_game(selected_game: str, use_async: bool = False) -> Game:
 
     if selected_game == supported_games[0]:
-        return CthulhuGame
+        return AsyncCthulhuGame if use_async else CthulhuGame
 
     elif selected_game == supported_games[1]:
-        return PulpCthulhuGame
+        return AsyncPulpCthulhuGame if use_async else PulpCthulhuGame
 
     else:
         raise ValueError
 
 
-def get_character_sheet() -> str:
-    return "pulp_cthulhu_Ana_Engel.json"
-
-
 class GameFactory:
 
     @classmethod
-    def create_game(cls, keypad: KeypadController, lcd: I2cLcd, selected_game: str):
-        file_path = get_character_sheet()
-        game = get_game(selected_game)
-        return game(keypad, lcd, file_path)
+    def create_game(
+        cls, keypad: KeypadController, lcd: I2cLcd, roster, selected_game: str, character_id: str = None,
+        use_async: bool = False
+    ):
+        """
+        :param: the Roster the character is loaded from
+        :param: roster ID, defaults to the first character that can play the game
+        :param: an asyncio game, whose loop() is awaited
+        """
+        if character_id is None:
+            ids = roster.ids(selected_game)
+            if not ids:
+                raise ValueError(f"no characters on the roster can play {selected_game}")
+            character_id = ids[0]
+        game = get_game(selected_game, use_async)
+        return game(keypad, lcd, roster.load(character_id))
@@ -1,5 +1,7 @@
 import json
 from collections import OrderedDict
+from lru import LRUCache
+from binary_sheet import SheetNode
 
 class JSONParser:
     """
@@ -8,12 +10,31 @@ class JSONParser:
     """
     @classmethod
     def load_json_file(cls, fpath: str):
-        json_str = ""
-        with open(fpath,'r') as file:
-            for entry in file:
-                json_str += entry
-        tmp_file = json.loads(json_str)
-        return cls.sort_json_file(tmp_file)
+        """
+        Loads a sheet and sorts it in one pass.
+
+        json.load parses straight from the file (on MicroPython without
+        ever holding the whole text), and each dict is emptied into its
+        sorted replacement as it goes, so peak memory stays close to the
+        size of the finished sheet instead of text + dict + sorted copy.
+        """
+        with open(fpath, 'r') as file:
+            tmp_file = json.load(file)
+        return cls._sort_consuming(tmp_file)
+
+    @classmethod
+    def _sort_consuming(cls, d: dict):
+        """
+        Same result as sort_json_file, but moves entries out of d
+        instead of copying them, d is left empty.
+        """
+        sorted_file = OrderedDict()
+        for k in sorted(d):
+            v = d.pop(k)
+            if isinstance(v, dict):
+                v = cls._sort_consuming(v)
+            sorted_file[k] = v
+        return sorted_file
 
     @classmethod
     def sort_json_file(cls, d: dict):
@@ -46,16 +67,12 @@ class JSONParser:
         for k, v in d.items():
             ret_str = '  ' * indent + str(k)
             yield ret_str
-            if isinstance(v, dict):
+            if isinstance(v, SECTION_TYPES):
                 yield from cls.pretty_print_keys(v, indent + 1)
                
     @classmethod
     def get_all_vals(cls, d: dict):
-        for v in d.values():
-            if isinstance(v, dict):
-                yield from cls.get_all_vals(v)
-            else:
-                yield v
+        return PathSelector.select(d, "**")
     
     @classmethod
     def get_keys(cls, d: dict) -> list[str]:
@@ -77,7 +94,302 @@ class JSONParser:
             return d[key]
         
         for v in d.values():
-            if isinstance(v, dict):
+            if isinstance(v, SECTION_TYPES):
                 value = cls.get_value_at_key(v, key)
                 if value is not None:  # the value could be 0, which we do want to return
-                    return value
\ No newline at end of file
+                    return value
+
+    @classmethod
+    def build_key_index(cls, d: dict) -> dict:
+        """
+        Flat index of every key to the paths it appears at.
+
+        Paths are tuples of keys from the top of d. They are listed in the
+        order get_value_at_key would find them, a dict's own keys before
+        anything nested under it, so paths[0] is its answer.
+        """
+        index = {}
+        cls._index_into(d, (), index)
+        return index
+
+    @classmethod
+    def _index_into(cls, d: dict, prefix: tuple, index: dict):
+        for k in d:
+            path = prefix + (k,)
+            if k in index:
+                index[k].append(path)
+            else:
+                index[k] = [path]
+        for k, v in d.items():
+            if isinstance(v, SECTION_TYPES):
+                cls._index_into(v, prefix + (k,), index)
+
+    @classmethod
+    def get_value_at_path(cls, d: dict, path: tuple):
+        for k in path:
+            d = d[k]
+        return d
+
+    @classmethod
+    def scan_sections(cls, fpath: str, chunk_size: int = 256) -> dict:
+        """
+        Byte offsets of each top level value in a JSON object file,
+        found without parsing anything below the top level.
+
+        :return: key -> (start, end), file[start:end] is the value's text
+        """
+        sections = {}
+        depth = 0
+        in_string = escaped = False
+        key = None
+        key_start = start = -1
+        pos = 0
+        with open(fpath, 'rb') as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                for c in chunk:
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif c == 0x5C:  # backslash
+                            escaped = True
+                        elif c == 0x22:  # closing quote
+                            in_string = False
+                            if depth == 1 and key is None and start < 0:
+                                key_start = (key_start, pos + 1)
+                    elif c == 0x22:
+                        in_string = True
+                        if depth == 1 and key is None and start < 0:
+                            key_start = pos
+                    elif c == 0x3A and depth == 1 and start < 0:  # colon
+                        key = key_start
+                        start = pos + 1
+                    elif c == 0x7B or c == 0x5B:  # { [
+                        depth += 1
+                    elif c == 0x7D or c == 0x5D or (c == 0x2C and depth == 1):  # } ] ,
+                        if depth == 1 and key is not None:
+                            sections[key] = (start, pos)
+                            key = None
+                            start = -1
+                        if c != 0x2C:
+                            depth -= 1
+                    pos += 1
+
+        # the keys are still offsets, read them back as strings
+        named = {}
+        with open(fpath, 'rb') as file:
+            for (k_start, k_end), value_range in sections.items():
+                file.seek(k_start)
+                named[json.loads(file.read(k_end - k_start).decode())] = value_range
+        return named
+
+    @classmethod
+    def load_section(cls, fpath: str, start: int, end: int):
+        """ Parses file[start:end] from scan_sections, dicts come back sorted """
+        with open(fpath, 'rb') as file:
+            file.seek(start)
+            value = json.loads(file.read(end - start).decode())
+        if isinstance(value, dict):
+            value = cls._sort_consuming(value)
+        return value
+
+
+class LazySheet:
+    """
+    Top level of a sheet that parses each section the first time it is used.
+
+    Only the byte offsets of the sections are read up front, so start up
+    time and memory follow the sections a session touches rather than
+    the size of the file. Iterating over every item loads everything.
+    """
+
+    def __init__(self, fpath: str):
+        self.fpath = fpath
+        self._offsets = JSONParser.scan_sections(fpath)
+        self._loaded = {}
+        self._keys = sorted(self._offsets)
+        # called with (key, value) as each section is parsed, may raise to reject it
+        self.on_load = None
+
+    @property
+    def loaded(self) -> list[str]:
+        """ Sections parsed so far """
+        return [k for k in self._keys if k in self._loaded]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return key in self._loaded or key in self._offsets
+
+    def __getitem__(self, key):
+        if key in self._loaded:
+            return self._loaded[key]
+        start, end = self._offsets[key]
+        value = JSONParser.load_section(self.fpath, start, end)
+        if self.on_load is not None:
+            self.on_load(key, value)
+        self._loaded[key] = value
+        del self._offsets[key]
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._keys.append(key)
+            self._keys.sort()
+        self._offsets.pop(key, None)
+        self._loaded[key] = value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return iter(self._keys)
+
+    def values(self):
+        for k in self._keys:
+            yield self[k]
+
+    def items(self):
+        for k in self._keys:
+            yield k, self[k]
+
+    def to_dict(self) -> OrderedDict:
+        """ The whole sheet, as load_json_file would have returned it """
+        return OrderedDict(self.items())
+
+
+# what counts as a section, compiled sheets hand out SheetNodes
+SECTION_TYPES = (dict, SheetNode, LazySheet)
+
+
+class PathSelector:
+    """
+    Compiled selectors for reading many values out of a sheet at once.
+
+        Combat.Weapons.*.Name    every weapon's name
+        Skills.**                every skill value, however deeply nested
+        Combat.**.Name           every Name under Combat, at any depth
+        Skills."Elec. Repair"    quote keys holding dots, or a literal * or **
+
+    Each expression is compiled once into a chain of closures and kept
+    in a small LRU. Selections are generators, nothing is collected.
+    Keys missing from a sheet just select nothing.
+    """
+
+    _cache = LRUCache(32)
+
+    @classmethod
+    def compile(cls, expression: str, with_paths: bool = False):
+        """ :return: accessor taking a sheet, yielding values or (path, value) """
+        key = (expression, with_paths)
+        accessor = cls._cache.get(key)
+        if accessor is None:
+            accessor = cls._build(cls._split(expression), with_paths)
+            cls._cache.put(key, accessor)
+        return accessor
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def select(cls, d: dict, expression: str):
+        """ Values matching expression """
+        return cls.compile(expression)(d)
+
+    @classmethod
+    def select_items(cls, d: dict, expression: str):
+        """ (path tuple, value) for every match """
+        return cls.compile(expression, True)(d)
+
+    @classmethod
+    def _split(cls, expression: str) -> list:
+        """ 'a."b.c".*' -> [('a', False), ('b.c', True), ('*', False)] """
+        segments = []
+        current = ""
+        quoted = in_quotes = False
+        for c in expression:
+            if c == '"':
+                in_quotes = not in_quotes
+                quoted = True
+            elif c == '.' and not in_quotes:
+                segments.append((current, quoted))
+                current = ""
+                quoted = False
+            else:
+                current += c
+        if in_quotes:
+            raise ValueError(f"unclosed quote in '{expression}'")
+        segments.append((current, quoted))
+        for segment, quoted in segments:
+            if not segment and not quoted:
+                raise ValueError(f"empty key in '{expression}'")
+        return segments
+
+    @classmethod
+    def _build(cls, segments: list, with_paths: bool):
+        if with_paths:
+            def accessor(value, path):
+                yield path, value
+        else:
+            def accessor(value, path):
+                yield value
+
+        terminal = True
+        following_deep = False
+        for segment, quoted in reversed(segments):
+            deep = segment == "**" and not quoted
+            if deep and following_deep:
+                continue  # **.** matches no more than ** and would select everything twice
+            following_deep = deep
+            if quoted or segment not in ("*", "**"):
+                accessor = cls._key_step(segment, accessor, with_paths)
+            elif segment == "*":
+                accessor = cls._any_step(accessor, with_paths)
+            else:
+                accessor = cls._deep_step(accessor, with_paths, terminal)
+            terminal = False
+
+        def select(d: dict):
+            return accessor(d, ())
+        return select
+
+    @classmethod
+    def _key_step(cls, key: str, following, with_paths: bool):
+        def step(value, path):
+            if isinstance(value, SECTION_TYPES) and key in value:
+                yield from following(value[key], path + (key,) if with_paths else path)
+        return step
+
+    @classmethod
+    def _any_step(cls, following, with_paths: bool):
+        def step(value, path):
+            if isinstance(value, SECTION_TYPES):
+                for k, v in value.items():
+                    yield from following(v, path + (k,) if with_paths else path)
+        return step
+
+    @classmethod
+    def _deep_step(cls, following, with_paths: bool, terminal: bool):
+        """
+        A trailing ** selects every leaf value below. Anywhere else it
+        matches zero or more keys, so the rest of the selector is tried
+        on this section and every section below it.
+        """
+        def step(value, path):
+            if isinstance(value, SECTION_TYPES):
+                if not terminal:
+                    yield from following(value, path)
+                for k, v in value.items():
+                    child = path + (k,) if with_paths else path
+                    if isinstance(v, SECTION_TYPES):
+                        yield from step(v, child)
+                    elif terminal:
+                        yield from following(v, child)
+        return step
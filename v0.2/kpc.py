@@ -1,5 +1,13 @@
+import asyncio
 import picokeypad
+from machine import Timer, idle
 from micropython import const
+from utime import ticks_ms, ticks_diff, ticks_add
+
+# Key event kinds #
+PRESS = const(0)
+RELEASE = const(1)
+HOLD = const(2)
 
 class Color:
     """
@@ -16,6 +24,62 @@ class Color:
     black = 	(0x00, 0x00, 0x00)
     
 
+class KeyEvents:
+    """
+    Bounded ring buffer of key events, filled by the keypad sampler.
+
+    Each event is one byte, kind << 4 | button, so pushing an event
+    from the timer callback doesn't allocate.
+
+    put() runs in the timer callback and get() in the main code, so
+    neither may write what the other does: only put() moves _tail and
+    only get() and clear() move _head. One slot is left empty so a
+    full buffer can be told apart from an empty one.
+    """
+
+    def __init__(self, size: int = 32):
+        self._buf = bytearray(size + 1)
+        self._head = 0  # next event to read
+        self._tail = 0  # where the next event goes
+        self.dropped = 0  # events lost to a full buffer
+
+    def __len__(self):
+        return (self._tail - self._head) % len(self._buf)
+
+    def put(self, kind: int, button: int) -> bool:
+        """ :return: False if the buffer was full and the event was dropped """
+        tail = self._tail
+        next_tail = (tail + 1) % len(self._buf)
+        if next_tail == self._head:
+            self.dropped += 1
+            return False
+        self._buf[tail] = (kind << 4) | button
+        # published last, get() never sees the slot before it is written
+        self._tail = next_tail
+        return True
+
+    def get(self):
+        """ :return: (kind, button) of the oldest event, None if there isn't one """
+        head = self._head
+        if head == self._tail:
+            return None
+        event = self._buf[head]
+        self._head = (head + 1) % len(self._buf)
+        return event >> 4, event & 0x0f
+
+    def peek(self):
+        """ :return: (kind, button) of the oldest event, left queued, None if there isn't one """
+        head = self._head
+        if head == self._tail:
+            return None
+        event = self._buf[head]
+        return event >> 4, event & 0x0f
+
+    def clear(self):
+        """ Drops the queued events, anything put() meanwhile is kept """
+        self._head = self._tail
+
+
 class KeypadController:
     # Menu buttons #
     ACCEPT = const(10)
@@ -25,8 +89,19 @@ class KeypadController:
     DOWN_MENU = const(14)
     PAGE_DOWN = const(15)
 
+    # Sampling #
+    sample_ms = 10
+    debounce_samples = 3  # samples a change must hold for before it counts
+    hold_ms = 600  # a key down this long also sends a HOLD event
+
     def __init__(self):
-        self._prev_btn_states = 0 # for checking states
+        self._idle_tasks = []  # short callables run while waiting for input
+        self.events = KeyEvents()
+        self._btn_states = 0  # debounced
+        self._candidate = 0  # raw states waiting out the debounce
+        self._stable = 0  # samples the candidate has held for
+        self._held = 0  # keys that have sent their HOLD event
+        self._down_at = [0] * 16  # ticks_ms each key went down
         
         self.keypad = picokeypad.PicoKeypad()
         self.keypad.set_brightness(0.50) # accepts a float from 0 - 1.0
@@ -50,27 +125,126 @@ class KeypadController:
         ]
         # light-up the keys
         self.default_layout()
-        
+        # keys are sampled in the background so none are missed while the game sleeps
+        self._timer = Timer(mode=Timer.PERIODIC, period=self.sample_ms, callback=self._sample)
+
+    def stop(self):
+        """ Stops sampling the keypad """
+        self._timer.deinit()
+
+    def _sample(self, _timer=None):
+        """
+        Reads the keys once, debounces, and queues press/release/hold events.
+        Runs from the timer every sample_ms.
+        """
+        btn_states = self.keypad.get_button_states()
+        if btn_states != self._candidate:
+            self._candidate = btn_states
+            self._stable = 0
+        elif self._stable < self.debounce_samples:
+            self._stable += 1
+            if self._stable == self.debounce_samples:
+                self._apply(btn_states)
+
+        if self._btn_states != self._held:
+            now = ticks_ms()
+            waiting = self._btn_states & ~self._held
+            for button in range(16):
+                if waiting & (1 << button) and ticks_diff(now, self._down_at[button]) >= self.hold_ms:
+                    self._held |= 1 << button
+                    self.events.put(HOLD, button)
+
+    def _apply(self, btn_states):
+        changed = btn_states ^ self._btn_states
+        now = ticks_ms()
+        for button in range(16):
+            mask = 1 << button
+            if changed & mask:
+                if btn_states & mask:
+                    self._down_at[button] = now
+                    self.events.put(PRESS, button)
+                else:
+                    self._held &= ~mask
+                    self.events.put(RELEASE, button)
+        self._btn_states = btn_states
+
+    def get_event(self, timeout_ms=None, consume=True):
+        """
+        Waits for the next key event, running the idle tasks meanwhile.
+
+        :param timeout_ms - give up after this long, None waits for ever
+        :param consume - False leaves the event queued for the next call
+        :return: (kind, button), kind is PRESS, RELEASE or HOLD, None on timeout
+        """
+        if timeout_ms is not None:
+            deadline = ticks_add(ticks_ms(), timeout_ms)
+        take = self.events.get if consume else self.events.peek
+        event = take()
+        while event is None:
+            if timeout_ms is not None and ticks_diff(ticks_ms(), deadline) >= 0:
+                return None
+            for task in self._idle_tasks:
+                task()
+            if not len(self.events):
+                idle()  # sleeps until the next interrupt, the sampler or otherwise
+            event = take()
+        return event
+
+    def clear_events(self):
+        """ Forgets keys pressed before now, e.g. while a message was showing """
+        self.events.clear()
+
+    def add_idle_task(self, task):
+        """
+        Registers a callable to run while get_button_press waits.
+        Keep tasks short, they delay noticing a keypress.
+        """
+        self._idle_tasks.append(task)
+
+    def remove_idle_task(self, task):
+        if task in self._idle_tasks:
+            self._idle_tasks.remove(task)
+
     def get_button_press(self, btn_range=16):
-        done = False
-        pressed = 0
-        while not done:
-            btn_states = self.keypad.get_button_states()
-            button = 0
-            if self._prev_btn_states != btn_states:
-                self._prev_btn_states = btn_states
-                # First we have to find the button that was pressed
-                for find in range(btn_range):
-                    if btn_states & 0x01 > 0:
-                        # make sure no other buttons were pressed
-                        if not (btn_states & (~0x01)):
-                            done = True
-                            pressed = button
-                        break
-                    # else, check the next button
-                    btn_states >>= 1
-                    button += 1
-        return pressed
+        """
+        Waits for a key to be pressed, including ones pressed while the
+        game was busy.
+
+        :param btn_range - only buttons below this count
+        :return the button, 0-15
+        """
+        while True:
+            kind, button = self.get_event()
+            if kind == PRESS and button < btn_range:
+                return button
+
+    async def wait_event(self, timeout_ms=None, consume=True):
+        """
+        get_event() for asyncio, other tasks run between samples.
+
+        :param timeout_ms - give up after this long, None waits for ever
+        :param consume - False leaves the event queued for the next call
+        :return: (kind, button), kind is PRESS, RELEASE or HOLD, None on timeout
+        """
+        if timeout_ms is not None:
+            deadline = ticks_add(ticks_ms(), timeout_ms)
+        take = self.events.get if consume else self.events.peek
+        event = take()
+        while event is None:
+            if timeout_ms is not None and ticks_diff(ticks_ms(), deadline) >= 0:
+                return None
+            for task in self._idle_tasks:
+                task()
+            await asyncio.sleep_ms(self.sample_ms)
+            event = take()
+        return event
+
+    async def wait_button_press(self, btn_range=16):
+        """ get_button_press() for asyncio """
+        while True:
+            kind, button = await self.wait_event()
+            if kind == PRESS and button < btn_range:
+                return button
 
     def check_num_buttons(self):
         result = 0
@@ -78,49 +252,34 @@ class KeypadController:
         decimal_place = 10
         lit = []
         while not done:
-            btn_states = self.keypad.get_button_states()
-            
-            if self._prev_btn_states != btn_states:
-                self._prev_btn_states = btn_states
-                # First we have to find the button that was pressed
-                button = 0
+            button = self.get_button_press(12)
+            changed = True
 
-                changed = False
-                for find in range(12):
-                    if btn_states & 0x01 > 0:
-                        # make sure no other buttons were pressed
-                        if not (btn_states & (~0x01)):  
-                            changed = True
-                        break
-                    # else, check the next button
-                    btn_states >>= 1
-                    button += 1
+            # toggle the color of the button
+            if decimal_place == 10 and button < 10:
+                self.buttons[button] = Color.pink
+                result += (button * decimal_place)
+                decimal_place /= 10
+                lit.append(button)
                 
-                # toggle the color of the button
-                if decimal_place == 10 and button < 10:
-                    self.buttons[button] = Color.pink
-                    result += (button * decimal_place)
-                    decimal_place /= 10
-                    lit.append(button)
+            elif decimal_place == 1 and button < 10:
+                self.buttons[button] = Color.lt_blue
+                result += button
+                lit.append(button)
+            
+            elif button == 11:
+                # reset the numbers
+                self.reset_number_buttons() 
+                changed = False
+                result = 0
+                if decimal_place == 1:
+                    decimal_place *= 10
                     
-                elif decimal_place == 1 and button < 10:
-                    self.buttons[button] = Color.lt_blue
-                    result += button
-                    lit.append(button)
-                
-                elif button == 11:
-                    # reset the numbers
-                    self.reset_number_buttons() 
-                    changed = False
-                    result = 0
-                    if decimal_place == 1:
-                        decimal_place *= 10
+            elif button == 10:
+                done = True
                         
-                elif button == 10:
-                    done = True
-                            
-                if changed:
-                    self.light_button(button, self.buttons[button])
+            if changed:
+                self.light_button(button, self.buttons[button])
 
         self.reset_number_buttons()
         return int(result)
@@ -0,0 +1,73 @@
+"""
+Least recently used cache shared by the compiled dice plans, selectors,
+distributions, alias tables and the roster's loaded characters.
+
+MicroPython's OrderedDict has no move_to_end, so an entry is marked
+as most recently used by popping and re-inserting it.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_size: int, size_of=None, on_evict=None):
+        """
+        :param: most the entries may add up to
+        :param: size of a value, each entry counts as 1 if not given
+        :param: called with (key, value) for every entry dropped to make room
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._size_of = size_of
+        self._on_evict = on_evict
+        self._entries = OrderedDict()  # least recently used first
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def items(self):
+        """ (key, value) pairs, least recently used first """
+        return self._entries.items()
+
+    def get(self, key, default=None):
+        """ The value for key, marking it as most recently used """
+        value = self._entries.pop(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """ Stores value as the most recently used, dropping the oldest over max_size """
+        self.pop(key)
+        self._entries[key] = value
+        self.size += self._measure(value)
+        # the newest entry stays even if it alone is over max_size
+        while self.size > self.max_size and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            evicted = self.pop(oldest)
+            if self._on_evict is not None:
+                self._on_evict(oldest, evicted)
+
+    def pop(self, key, default=None):
+        """ Removes key without calling on_evict """
+        value = self._entries.pop(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.size -= self._measure(value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _measure(self, value) -> int:
+        return 1 if self._size_of is None else self._size_of(value)
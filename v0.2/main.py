@@ -5,18 +5,26 @@ credit: https://www.tomshardware.com/how-to/lcd-display-raspberry-pi-pico
 __author__ = "Nathan Winslow"
 __copyright__ = "MIT"
 
+import asyncio
 from micropython import const
 from machine import I2C, Pin
 from time import sleep
 from I2C_LCD import I2cLcd
 from kpc import KeypadController, Color
 from game_factory import GameFactory, supported_games
+from game import Game
+from dice import Dice
+from roll_audit import RollAuditor
+from roster import Roster
 
 
 # change these for your particular screen
 _NUM_OF_ROWS = const(4)
 _NUM_OF_COLS = const(20)
 
+# run the game, web API and LED blink together in one asyncio loop
+RUN_ASYNC = False
+
 
 i2c = I2C(0, sda=Pin(4), scl=Pin(5), freq=100_000)
 i2c_addr = i2c.scan()[1]  # in this build address[0] is the keypad IO
@@ -25,6 +33,15 @@ lcd = I2cLcd(i2c, i2c_addr, _NUM_OF_ROWS, _NUM_OF_COLS)
 # Keypad
 keypad = KeypadController()
 
+# menus outside a game scroll through lists the way the games do
+menu = Game(keypad, lcd)
+
+# the one roster, shared by the games and the web API
+roster = Roster()
+
+# Count every roll so players can check the dice are fair
+Dice.auditor = RollAuditor()
+
 
 def welcome_splash():
     msg = " " * (_NUM_OF_COLS - 16)
@@ -34,6 +51,14 @@ def welcome_splash():
     reset_lcd()
 
 
+def left_off_splash():
+    """ Says how many sheets the roster couldn't read, they are fixed on the host """
+    count = len(roster.left_off)
+    lcd.putstr(f"{count} sheet{'s' if count > 1 else ''} left\noff the roster,\ncheck the JSON.")
+    sleep(3)
+    reset_lcd()
+
+
 def reset_lcd():
     lcd.clear()
     lcd.blink_cursor_off()
@@ -79,8 +104,39 @@ def game_menu():
         keypress = keypad.get_button_press()
 
     selected = supported_games[keypress]
-    game = GameFactory.create_game(keypad, lcd, selected)
+    character_id = character_menu(selected)
+    if character_id is None:
+        return
+    game = GameFactory.create_game(keypad, lcd, roster, selected, character_id)
     game.loop()
+    roster.refresh_summaries()
+
+
+def character_menu(selected_game: str) -> str:
+    """
+    Picks an investigator from the roster index, no sheets are parsed
+
+    :return: roster ID, None if nobody on the roster can play selected_game
+    """
+    ids = roster.ids(selected_game)
+    if not ids:
+        reset_lcd()
+        lcd.show(no_investigators_screen(selected_game))
+        keypad.get_button_press()
+        return None
+    if len(ids) == 1:
+        return ids[0]
+
+    lines = []
+    for character_id in ids:
+        entry = roster.summary(character_id)
+        lines.append(f"{entry['name'][:11]} {entry['hp']}/{entry['san']}")
+    reset_lcd()
+    return ids[menu.select_index_from_list(lines)]
+
+
+def no_investigators_screen(selected_game: str) -> str:
+    return f"No investigators\nfor {selected_game}\nPress any key"
 
 
 def download_character_menu():
@@ -92,6 +148,9 @@ def download_game_menu():
 
 
 def power_off():
+    # anything still held back by the write-behind would be lost
+    Game.write_behind.flush()
+    roster.refresh_summaries()
     reset_lcd()
     lcd.putstr("Until next time.\n")
     sleep(2)
@@ -119,9 +178,40 @@ Start up Procedure
 """
 
 
+async def async_main():
+    """
+    Sample asyncio wiring: the keypad/LCD game, the web API and the LED
+    blink share one event loop, so the web API keeps answering mid game.
+    """
+    from web_api import api_async
+
+    await api_async.serve(roster)
+    asyncio.create_task(api_async.blink_led())
+
+    options = supported_games + ["Exit"]
+    keypress = -1
+    while keypress != len(options) - 1:
+        lcd.blink_cursor_off()
+        await lcd.show_async("".join(f"{i}: {option} \n" for i, option in enumerate(options)))
+        keypress = await keypad.wait_button_press(len(options))
+        if keypress < len(supported_games):
+            if not roster.ids(supported_games[keypress]):
+                await lcd.show_async(no_investigators_screen(supported_games[keypress]))
+                await keypad.wait_button_press()
+                continue
+            game = GameFactory.create_game(keypad, lcd, roster, supported_games[keypress], use_async=True)
+            await game.loop()
+            roster.refresh_summaries()
+
+
 def main():
     # welcome_splash()
-    main_menu()
+    if roster.left_off:
+        left_off_splash()
+    if RUN_ASYNC:
+        asyncio.run(async_main())
+    else:
+        main_menu()
 
 
 try:
@@ -0,0 +1,470 @@
+"""
+Seedable random number generators for the dice classes.
+
+Any object with a `randint(a, b)` method can stand in for these,
+including the `random` module itself.
+
+Streams are RandomStreams, on the C generator behind random.Random,
+wherever that exists, and XorShift32s on MicroPython, which only has
+the one module level generator. A seed replays the same rolls on the
+same kind of platform; use XorShift32 directly for rolls that must
+match between the host and the Pico.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+try:
+    from random import Random
+except ImportError:  # MicroPython
+    Random = None
+
+_MASK_32 = 0xFFFFFFFF
+
+
+def _entropy() -> int:
+    """ 32 bits of seed material from the best source available """
+    try:
+        from os import urandom
+        b = urandom(4)
+        return b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+    except (ImportError, AttributeError, NotImplementedError):
+        from time import time
+        return int(time() * 1_000_000) & _MASK_32
+
+
+def _fnv1a(name: str) -> int:
+    """ Stable 32 bit hash, str.__hash__ changes between CPython runs """
+    h = 0x811C9DC5
+    for byte in name.encode():
+        h = ((h ^ byte) * 0x01000193) & _MASK_32
+    return h
+
+
+class XorShift32:
+    """
+    Marsaglia's xorshift32 generator.
+
+    The 32 bit state is kept as two 16 bit halves, so stepping it never
+    leaves MicroPython's small ints (below 2 ** 30) and allocates nothing.
+    Bounded draws use bitmask rejection on bits taken 16 at a time from
+    the state, so they are unbiased and need no float math or division.
+    """
+
+    def __init__(self, seed: int = None, name: str = ""):
+        self.name = name
+        self._widths = {}  # n -> bits needed to draw below n
+        self.generation = 0  # bumped by every seed(), lets RollPool notice a reseed
+        self.seed(seed)
+
+    def seed(self, seed: int = None):
+        if seed is None:
+            seed = _entropy()
+        self.initial_seed = seed & _MASK_32
+        self.generation += 1
+        # zero is a fixed point of xorshift
+        state = self.initial_seed or 0x9E3779B9
+        self._hi = state >> 16
+        self._lo = state & 0xFFFF
+        self._hi_unused = False  # the high half of the last step hasn't been drawn from yet
+        self._bits = 0
+        self._num_bits = 0
+        # nearby seeds give correlated first outputs, skip past them
+        for _ in range(8):
+            self._step()
+
+    def _step(self):
+        hi = self._hi
+        lo = self._lo
+        # x ^= x << 13, the high half first as it needs the old low half
+        hi ^= ((hi << 13) | (lo >> 3)) & 0xFFFF
+        lo ^= (lo << 13) & 0xFFFF
+        # x ^= x >> 17
+        lo ^= hi >> 1
+        # x ^= x << 5
+        hi ^= ((hi << 5) | (lo >> 11)) & 0xFFFF
+        lo ^= (lo << 5) & 0xFFFF
+        self._hi = hi
+        self._lo = lo
+
+    def next_u32(self) -> int:
+        """ The next whole state, a big int on MicroPython so keep it off hot paths """
+        self._step()
+        self._hi_unused = False
+        return (self._hi << 16) | self._lo
+
+    def _next_u16(self) -> int:
+        if self._hi_unused:
+            self._hi_unused = False
+            return self._hi
+        self._step()
+        self._hi_unused = True
+        return self._lo
+
+    def getrandbits(self, k: int) -> int:
+        if k > 16:
+            return (self.getrandbits(k - 16) << 16) | self._next_u16()
+        num_bits = self._num_bits
+        if num_bits < k:
+            self._bits = self._next_u16()
+            num_bits = 16
+        bits = self._bits
+        self._bits = bits >> k
+        self._num_bits = num_bits - k
+        return bits & ((1 << k) - 1)
+
+    def _width(self, n: int) -> int:
+        """ Bits needed to draw below n """
+        width = self._widths.get(n)
+        if width is None:
+            width = 0
+            while (1 << width) < n:
+                width += 1
+            self._widths[n] = width
+        return width
+
+    def randbelow(self, n: int) -> int:
+        """ Uniform integer in [0, n) """
+        width = self._width(n)
+        value = self.getrandbits(width)
+        while value >= n:
+            value = self.getrandbits(width)
+        return value
+
+    def randint(self, a: int, b: int) -> int:
+        """ Uniform integer in [a, b], same contract as random.randint """
+        return a + self.randbelow(b - a + 1)
+
+    def roll(self, num_sides: int) -> int:
+        return 1 + self.randbelow(num_sides)
+
+    def roll_total(self, num_dice: int, num_sides: int) -> int:
+        """ Sum of num_dice rolls of a num_sides die, one call for the whole pool """
+        width = self._widths.get(num_sides) or self._width(num_sides)
+        total = num_dice
+        if width > 16:
+            for _ in range(num_dice):
+                total += self.randbelow(num_sides)
+            return total
+
+        # randbelow's draws and _step inlined, taking the same bits in the
+        # same order, the calls would cost more than the draws themselves
+        mask = (1 << width) - 1
+        bits = self._bits
+        num_bits = self._num_bits
+        hi = self._hi
+        lo = self._lo
+        hi_unused = self._hi_unused
+        for _ in range(num_dice):
+            while True:
+                if num_bits < width:
+                    if hi_unused:
+                        bits = hi
+                        hi_unused = False
+                    else:
+                        hi ^= ((hi << 13) | (lo >> 3)) & 0xFFFF
+                        lo ^= (lo << 13) & 0xFFFF
+                        lo ^= hi >> 1
+                        hi ^= ((hi << 5) | (lo >> 11)) & 0xFFFF
+                        lo ^= (lo << 5) & 0xFFFF
+                        bits = lo
+                        hi_unused = True
+                    num_bits = 16
+                value = bits & mask
+                bits >>= width
+                num_bits -= width
+                if value < num_sides:
+                    break
+            total += value
+        self._bits = bits
+        self._num_bits = num_bits
+        self._hi = hi
+        self._lo = lo
+        self._hi_unused = hi_unused
+        return total
+
+    def random(self) -> float:
+        """ Float in [0, 1), only for approximations that need one """
+        return (self._next_u16() + self._next_u16() / 65536) / 65536
+
+    def fill(self, buffer, num_sides: int):
+        """
+        Fills a preallocated buffer (array, bytearray or list) with rolls
+        of a num_sides die, for batched draws without per-roll calls.
+        """
+        randbelow = self.randbelow
+        for i in range(len(buffer)):
+            buffer[i] = 1 + randbelow(num_sides)
+        return buffer
+
+
+if Random is not None:
+    class RandomStream(Random):
+        """
+        random.Random with the XorShift32 interface. Its bits come from
+        C, so on the host it outruns any generator written in Python.
+        """
+
+        def __init__(self, seed: int = None, name: str = ""):
+            self.name = name
+            self.generation = 0  # bumped by every seed(), lets RollPool notice a reseed
+            super().__init__(seed)
+
+        def seed(self, seed: int = None, version: int = 2):
+            if seed is None:
+                seed = _entropy()
+            self.initial_seed = seed & _MASK_32
+            self.generation += 1
+            super().seed(self.initial_seed, version)
+
+        def next_u32(self) -> int:
+            return self.getrandbits(32)
+
+        def randbelow(self, n: int) -> int:
+            """ Uniform integer in [0, n) """
+            getrandbits = self.getrandbits
+            width = (n - 1).bit_length()
+            value = getrandbits(width)
+            while value >= n:
+                value = getrandbits(width)
+            return value
+
+        def randint(self, a: int, b: int) -> int:
+            """ Uniform integer in [a, b], same contract as random.randint """
+            # randbelow inlined, this is the call every single die goes through
+            getrandbits = self.getrandbits
+            n = b - a + 1
+            width = (b - a).bit_length()
+            value = getrandbits(width)
+            while value >= n:
+                value = getrandbits(width)
+            return a + value
+
+        def roll(self, num_sides: int) -> int:
+            return 1 + self.randbelow(num_sides)
+
+        def roll_total(self, num_dice: int, num_sides: int) -> int:
+            """ Sum of num_dice rolls of a num_sides die, one call for the whole pool """
+            getrandbits = self.getrandbits
+            width = (num_sides - 1).bit_length()
+            total = num_dice
+            for _ in range(num_dice):
+                value = getrandbits(width)
+                while value >= num_sides:
+                    value = getrandbits(width)
+                total += value
+            return total
+
+        def fill(self, buffer, num_sides: int):
+            randbelow = self.randbelow
+            for i in range(len(buffer)):
+                buffer[i] = 1 + randbelow(num_sides)
+            return buffer
+
+    # the fastest seedable generator on this platform
+    Stream = RandomStream
+else:
+    Stream = XorShift32
+
+
+class RNG:
+    """
+    Registry of named, seedable streams.
+
+    Give every session or character its own stream so a contested
+    roll can be replayed from the stream's seed. When a master seed
+    is set, each stream's seed is derived from it and the stream name,
+    making a whole session reproducible from one number.
+    """
+
+    master_seed = None
+    _streams = {}
+
+    @classmethod
+    def stream(cls, name: str, seed: int = None) -> Stream:
+        """
+        Returns the stream called name, creating it on first use.
+
+        :param: stream name, e.g. a character name
+        :param: explicit seed, reseeds an existing stream
+        """
+        rng = cls._streams.get(name)
+        if rng is None:
+            rng = Stream(cls._seed_for(name, seed), name)
+            cls._streams[name] = rng
+        elif seed is not None:
+            rng.seed(seed)
+        return rng
+
+    @classmethod
+    def seed_all(cls, master_seed: int):
+        """ Sets the master seed and reseeds every existing stream from it """
+        cls.master_seed = master_seed
+        for name, rng in cls._streams.items():
+            rng.seed(cls._seed_for(name, None))
+
+    @classmethod
+    def seeds(cls) -> dict:
+        """ name -> seed of every stream, enough to replay a session """
+        return {name: rng.initial_seed for name, rng in cls._streams.items()}
+
+    @classmethod
+    def _seed_for(cls, name: str, seed: int):
+        if seed is not None or cls.master_seed is None:
+            return seed
+        return (_fnv1a(name) ^ cls.master_seed) & _MASK_32
+
+
+# sides -> number of pre-rolled values kept, one byte each
+DEFAULT_POOL_SIZES = {4: 32, 6: 64, 8: 32, 10: 32, 100: 32}
+
+
+class RollPool:
+    """
+    Pre-rolled values for common die sizes in front of a generator.
+
+    Rolling a pooled size pops the next value from a ring buffer, so
+    the work of generating it happens earlier, e.g. while the keypad
+    waits for input. Pool d100 serves skill rolls with no bonus or
+    penalty dice; those with them draw once from the whole outcome
+    table, as do other ranges, straight from the source generator.
+
+    Each pooled size draws from its own child stream, seeded from the
+    source's seed and the die size, and values are used in the order
+    they were generated, so results do not depend on when refill()
+    happened to run. Reseeding the source, e.g. by RNG.seed_all,
+    rebuilds the child streams and drops the pre-rolled values, so the
+    source's seed alone replays every pooled roll.
+    """
+
+    def __init__(self, source, sizes: dict = None):
+        """
+        :param: XorShift32 or RandomStream, the child streams are the same kind
+        :param: dict of sides -> pool capacity, defaults to DEFAULT_POOL_SIZES
+        """
+        if sizes is None:
+            sizes = DEFAULT_POOL_SIZES
+        self.source = source
+        self._generation = None  # source.generation the child streams were seeded at
+        self._pools = {}
+        for sides, capacity in sorted(sizes.items()):
+            if not 1 < sides <= 256:
+                raise ValueError(f"can only pool dice with 2 - 256 sides, not {sides}")
+            # [child stream, ring buffer, head index, count]
+            self._pools[sides] = [None, bytearray(capacity), 0, 0]
+        self._reseed()
+
+    def _reseed(self):
+        """ Rebuilds the child streams from the source's seed and drops the pre-rolled values """
+        seed = self.source.initial_seed
+        for sides, pool in self._pools.items():
+            pool[0] = type(self.source)(_fnv1a(f"{seed}/d{sides}"), f"{self.source.name}/d{sides}")
+            pool[2] = 0
+            pool[3] = 0
+        self._generation = self.source.generation
+        self.refill()
+
+    @property
+    def name(self) -> str:
+        return self.source.name
+
+    @property
+    def initial_seed(self) -> int:
+        return self.source.initial_seed
+
+    @property
+    def memory(self) -> int:
+        """ Bytes held by the pools """
+        return sum(len(pool[1]) for pool in self._pools.values())
+
+    def available(self, num_sides: int) -> int:
+        pool = self._pools.get(num_sides)
+        return pool[3] if pool else 0
+
+    def refill(self, budget: int = None) -> int:
+        """
+        Tops the pools back up.
+
+        :param: max number of values to generate, keeps idle work short
+        :return: number of values generated
+        """
+        if self.source.generation != self._generation:
+            self._reseed()
+        generated = 0
+        for sides, pool in self._pools.items():
+            child, buf, head, count = pool
+            capacity = len(buf)
+            while count < capacity:
+                if budget is not None and generated >= budget:
+                    pool[3] = count
+                    return generated
+                tail = head + count
+                if tail >= capacity:
+                    tail -= capacity
+                buf[tail] = child.randbelow(sides)
+                count += 1
+                generated += 1
+            pool[3] = count
+        return generated
+
+    def randbelow(self, n: int) -> int:
+        return self.randint(0, n - 1)
+
+    def randint(self, a: int, b: int) -> int:
+        # the hot path, so it does the work and the others call it
+        if self.source.generation != self._generation:
+            self._reseed()
+        pool = self._pools.get(b - a + 1)
+        if pool is None:
+            return self.source.randint(a, b)
+        count = pool[3]
+        if count == 0:
+            return pool[0].randint(a, b)
+        buf = pool[1]
+        head = pool[2]
+        value = buf[head]
+        head += 1
+        pool[2] = 0 if head == len(buf) else head
+        pool[3] = count - 1
+        return a + value
+
+    def roll(self, num_sides: int) -> int:
+        return self.randint(1, num_sides)
+
+    def roll_total(self, num_dice: int, num_sides: int) -> int:
+        """ Sum of num_dice rolls, taking the same values in the same order as roll() would """
+        if self.source.generation != self._generation:
+            self._reseed()
+        pool = self._pools.get(num_sides)
+        if pool is None:
+            return self.source.roll_total(num_dice, num_sides)
+        count = pool[3]
+        if count == 0:
+            return pool[0].roll_total(num_dice, num_sides)
+        buf = pool[1]
+        head = pool[2]
+        taken = num_dice if num_dice < count else count
+        capacity = len(buf)
+        total = taken
+        for _ in range(taken):
+            total += buf[head]
+            head += 1
+            if head == capacity:
+                head = 0
+        pool[2] = head
+        pool[3] = count - taken
+        if taken < num_dice:
+            total += pool[0].roll_total(num_dice - taken, num_sides)
+        return total
+
+    def getrandbits(self, k: int) -> int:
+        return self.source.getrandbits(k)
+
+    def random(self) -> float:
+        return self.source.random()
+
+    def fill(self, buffer, num_sides: int):
+        randbelow = self.randbelow
+        for i in range(len(buffer)):
+            buffer[i] = 1 + randbelow(num_sides)
+        return buffer
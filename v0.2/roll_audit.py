@@ -0,0 +1,152 @@
+"""
+Streaming fairness audit of the dice, cheap enough to leave running.
+
+Counts every die face rolled through Dice and every d100 skill result
+in fixed size array counters, so memory never grows with the number
+of rolls, and keeps a chi-square statistic per die type.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from array import array
+from distribution import chi_square_p_value
+
+
+class Histogram:
+    """
+    Fixed size outcome counter with a chi-square test.
+
+    For uniform dice the statistic is kept online from a running sum of
+    squared counts, in integers so it stays exact on the Pico's single
+    precision floats:
+
+        chi2 = (k * sum(c_i ** 2) - n ** 2) / n
+
+    Weighted outcomes (skill rolls with bonus/penalty dice) are scored
+    from the counters when a report is asked for.
+    """
+
+    def __init__(self, size: int, weights: tuple = None):
+        """
+        :param: number of outcomes
+        :param: integer weight of each outcome, None for uniform
+        """
+        self.counts = array('I', (0 for _ in range(size)))
+        self.weights = weights
+        self.weight_total = sum(weights) if weights else size
+        self.rolls = 0
+        self._sum_squares = 0
+
+    def observe(self, index: int):
+        count = self.counts[index]
+        self.counts[index] = count + 1
+        self.rolls += 1
+        self._sum_squares += 2 * count + 1
+
+    def chi_square(self) -> tuple:
+        """ :return: (statistic, degrees of freedom) """
+        n = self.rolls
+        if n == 0:
+            return 0.0, 0
+        if self.weights is None:
+            k = len(self.counts)
+            return (k * self._sum_squares - n * n) / n, k - 1
+
+        stat = 0.0
+        dof = -1
+        for count, weight in zip(self.counts, self.weights):
+            if weight == 0:
+                continue
+            expected = n * weight / self.weight_total
+            stat += (count - expected) * (count - expected) / expected
+            dof += 1
+        return stat, dof
+
+    def p_value(self) -> float:
+        stat, dof = self.chi_square()
+        return chi_square_p_value(stat, dof)
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.rolls = 0
+        self._sum_squares = 0
+
+
+class RollAuditor:
+    """
+    Per die type histograms fed by Dice once set as Dice.auditor.
+
+    Only the die sizes in tracked_sides and skill rolls with up to
+    max_skill_modifier net bonus/penalty dice are counted, so the
+    memory used is fixed up front (about 3 KB with every type in use).
+    Batch rolls and alias-drawn large pools are not audited.
+    """
+
+    tracked_sides = (4, 6, 8, 10, 12, 20, 100)
+    max_skill_modifier = 2
+    # below this many rolls per outcome the chi-square p-value means little
+    min_rolls_per_outcome = 5
+
+    def __init__(self):
+        self.dice = {}  # sides -> Histogram
+        self.skills = {}  # net modifier -> Histogram
+
+    def observe_die(self, num_sides: int, face: int):
+        hist = self.dice.get(num_sides)
+        if hist is None:
+            if num_sides not in self.tracked_sides:
+                return
+            hist = Histogram(num_sides)
+            self.dice[num_sides] = hist
+        hist.observe(face - 1)
+
+    def observe_skill(self, net_modifier: int, roll: int, table_counts: tuple):
+        """
+        :param: bonus - penalty
+        :param: the d100 result
+        :param: counts from CthulhuDice.skill_table for the modifier
+        """
+        hist = self.skills.get(net_modifier)
+        if hist is None:
+            if abs(net_modifier) > self.max_skill_modifier:
+                return
+            hist = Histogram(100, None if net_modifier == 0 else table_counts)
+            self.skills[net_modifier] = hist
+        hist.observe(roll - 1)
+
+    def reset(self):
+        for hist in self.dice.values():
+            hist.reset()
+        for hist in self.skills.values():
+            hist.reset()
+
+    def _entries(self):
+        for sides in sorted(self.dice):
+            yield f"d{sides}", self.dice[sides]
+        for net in sorted(self.skills):
+            yield f"d100 {net:+d}", self.skills[net]
+
+    def report(self) -> dict:
+        """ For the web API: name -> rolls, chi2, dof, p and whether there is enough data """
+        report = {}
+        for name, hist in self._entries():
+            stat, dof = hist.chi_square()
+            report[name] = {
+                "rolls": hist.rolls,
+                "chi2": stat,
+                "dof": dof,
+                "p": chi_square_p_value(stat, dof),
+                "enough_data": hist.rolls >= self.min_rolls_per_outcome * len(hist.counts),
+            }
+        return report
+
+    def lcd_lines(self) -> list[str]:
+        """ One short line per die type, '?' marks too few rolls to judge """
+        lines = []
+        for name, hist in self._entries():
+            enough = hist.rolls >= self.min_rolls_per_outcome * len(hist.counts)
+            p = f"{hist.p_value():.2f}" if enough else "?"
+            lines.append(f"{name:<7}{hist.rolls:>6} p={p}")
+        return lines
@@ -0,0 +1,228 @@
+"""
+Roster of investigators kept on the device.
+
+An index file maps each character ID to its sheet file and a few
+summary fields, so the roster can be listed without parsing any
+sheets. Recently used characters stay loaded in a small LRU so
+switching back to one is instant.
+
+roster.json:
+
+    {
+        "pulp_cthulhu_Ana_Engel": {
+            "file": "pulp_cthulhu_Ana_Engel.json",
+            "name": "Ana Engel",
+            "game": "Pulp Cthulhu",
+            "hp": 12,
+            "san": 55
+        }
+    }
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+import json
+import os
+from lru import LRUCache
+from character_sheet import CthulhuCharacter, PulpCharacter
+from json_parser import JSONParser
+from binary_sheet import binary_path_for
+from sheet_journal import SheetJournal, replace_file, HIT_POINTS, SANITY
+from sheet_schema import schema_for
+
+CALL_OF_CTHULHU = "Call of Cthulhu"
+PULP_CTHULHU = "Pulp Cthulhu"
+
+# game a sheet was made for -> character class
+CHARACTER_CLASSES = {
+    CALL_OF_CTHULHU: CthulhuCharacter,
+    PULP_CTHULHU: PulpCharacter,
+}
+# game being played -> sheets it can use, Pulp sheets are Call of Cthulhu sheets plus talents
+PLAYABLE = {
+    CALL_OF_CTHULHU: (CALL_OF_CTHULHU, PULP_CTHULHU),
+    PULP_CTHULHU: (PULP_CTHULHU,),
+}
+# JSON files next to the sheets that aren't sheets
+_NOT_SHEETS = ("roster.json", "dice_bench_baseline.json")
+
+
+def game_of(sheet) -> str:
+    """ Which game a sheet was made for """
+    return PULP_CTHULHU if "Pulp Talents" in sheet else CALL_OF_CTHULHU
+
+
+class Roster:
+    index_file = "roster.json"
+    # loaded characters kept around, each holds its sheet and dice pools
+    max_loaded = 3
+
+    def __init__(self, index_file: str = None, directory: str = "."):
+        """
+        :param: index file, defaults to Roster.index_file
+        :param: where the sheets live, scanned when there is no index yet
+        """
+        self.directory = directory
+        self.fpath = self._join(index_file or self.index_file)
+        self._loaded = LRUCache(self.max_loaded, on_evict=self._evict)  # id -> character
+        self.left_off = {}  # sheet file -> why the last rebuild couldn't list it
+        try:
+            with open(self.fpath, "r") as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {}
+            self.rebuild()
+
+    def _join(self, fname: str) -> str:
+        return fname if self.directory == "." else self.directory + "/" + fname
+
+    def rebuild(self):
+        """
+        Indexes every sheet in the directory, parsing each one once.
+        Sheets that can't be read are kept in left_off for the UI to report.
+        """
+        self.index = {}
+        self.left_off = {}
+        for fname in sorted(os.listdir(self.directory)):
+            if fname.endswith(".json") and fname not in _NOT_SHEETS:
+                try:
+                    self.add(fname, save=False)
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    self.left_off[fname] = str(e)
+        self.save()
+
+    def add(self, fname: str, character_id: str = None, save: bool = True) -> str:
+        """
+        Adds a sheet file to the roster.
+
+        :param: sheet file name within the roster directory
+        :param: ID to list it under, defaults to the file name without .json
+        :return: the character ID
+        :raises: SchemaError if the sheet is malformed
+        """
+        if character_id is None:
+            character_id = fname.rsplit(".", 1)[0]
+        sheet = JSONParser.load_json_file(self._join(fname))
+        schema_for(sheet).validate(sheet)
+        characteristics = sheet["Characteristics"]
+        summary = {HIT_POINTS: characteristics["Hit Points"]["Current"], SANITY: characteristics["Sanity"]["Current"]}
+        # changes since the sheet was last compacted, as the character replays them on load
+        for kind, _, value, _ in SheetJournal(self._join(fname)).records():
+            if kind in summary:
+                summary[kind] = value
+        self.index[character_id] = {
+            "file": fname,
+            "name": sheet["Name"],
+            "game": game_of(sheet),
+            "hp": summary[HIT_POINTS],
+            "san": summary[SANITY],
+        }
+        self._loaded.pop(character_id, None)
+        if save:
+            self.save()
+        return character_id
+
+    def remove(self, character_id: str):
+        """ Drops a character from the roster, its sheet file is left alone """
+        del self.index[character_id]
+        self._loaded.pop(character_id, None)
+        self.save()
+
+    def reserved(self, character_id: str) -> bool:
+        """ True if a sheet saved as character_id would overwrite a file that isn't a roster sheet """
+        if character_id in self.index:
+            return False
+        if not character_id:
+            return True
+        fname = character_id + ".json"
+        if fname in _NOT_SHEETS or self._join(fname) == self.fpath:
+            return True
+        try:
+            os.stat(self._join(fname))
+        except OSError:
+            return False
+        return True
+
+    def import_sheet(self, character_id: str, sheet: dict) -> str:
+        """
+        Saves a validated sheet into the roster directory and adds it.
+
+        A sheet already listed under character_id is replaced, along with
+        its journal and compiled copy, which hold the old sheet's state.
+
+        :raises: ValueError if character_id is reserved
+        """
+        if self.reserved(character_id):
+            raise ValueError(f"'{character_id}' is a reserved name")
+        entry = self.index.get(character_id)
+        fname = entry["file"] if entry else character_id + ".json"
+        fpath = self._join(fname)
+
+        character = self._loaded.pop(character_id)
+        if character is not None and character.write_behind is not None:
+            character.write_behind.untrack(character)
+        with open(fpath + ".tmp", "w") as file:
+            json.dump(sheet, file)
+        replace_file(fpath + ".tmp", fpath)
+        for stale in (SheetJournal(fpath).fpath, binary_path_for(fpath)):
+            try:
+                os.remove(stale)
+            except OSError:  # there wasn't one
+                pass
+        return self.add(fname, character_id)
+
+    def save(self):
+        """ Atomically writes the index """
+        with open(self.fpath + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        replace_file(self.fpath + ".tmp", self.fpath)
+
+    def ids(self, game: str = None) -> list[str]:
+        """ Character IDs in order, only those playable in game if given """
+        if game is None:
+            return sorted(self.index)
+        games = PLAYABLE.get(game, (game,))
+        return [k for k in sorted(self.index) if self.index[k]["game"] in games]
+
+    def summary(self, character_id: str) -> dict:
+        return self.index[character_id]
+
+    def load(self, character_id: str):
+        """
+        The character for an ID, loaded lazily with its journal replayed.
+
+        :raises: KeyError for an ID that isn't on the roster
+        """
+        character = self._loaded.get(character_id)
+        if character is None:
+            entry = self.index[character_id]
+            character_class = CHARACTER_CLASSES.get(entry["game"], CthulhuCharacter)
+            character = character_class(self._join(entry["file"]), lazy=True, journal=True)
+            self._loaded.put(character_id, character)
+        return character
+
+    def _evict(self, character_id: str, character):
+        if character.dirty and character.write_behind is None:
+            character.flush()
+        if self._refresh(character_id, character):
+            self.save()
+
+    def _refresh(self, character_id: str, character) -> bool:
+        entry = self.index.get(character_id)
+        if entry is None:
+            return False
+        hp, san = character.current_hp, character.current_sanity
+        if entry["hp"] == hp and entry["san"] == san:
+            return False
+        entry["hp"] = hp
+        entry["san"] = san
+        return True
+
+    def refresh_summaries(self):
+        """ Copies HP/SAN of the loaded characters into the index, saving it if anything changed """
+        changed = False
+        for character_id, character in self._loaded.items():
+            changed = self._refresh(character_id, character) or changed
+        if changed:
+            self.save()
@@ -0,0 +1,215 @@
+"""
+Append-only journal of changes made to a character sheet in play.
+
+Rewriting the whole sheet for every HP or Sanity tick wears out flash
+and stalls the screen, so each change is appended as a small record
+instead and replayed over the sheet when it is loaded. Compaction folds
+the journal back into a new base sheet now and then.
+
+Record layout, little endian:
+
+    <BBhh  kind, name length, delta, value after the change
+    name   UTF-8, only for skill ticks
+
+Records carry the value after the change as well as the delta, so
+replaying one twice is harmless. If power is lost between compaction
+renaming the new base sheet and the new journal, the old journal still
+replays to the same state.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+import os
+import struct
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:  # CPython
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+_RECORD = "<BBhh"
+_RECORD_SIZE = struct.calcsize(_RECORD)
+
+HIT_POINTS = 1
+MAGIC_POINTS = 2
+SANITY = 3
+LUCK = 4
+WEAPON = 5
+SKILL_TICK = 6
+
+# kind -> path of the number it changes
+SHEET_PATHS = {
+    HIT_POINTS: ("Characteristics", "Hit Points", "Current"),
+    MAGIC_POINTS: ("Characteristics", "Magic Points", "Current"),
+    SANITY: ("Characteristics", "Sanity", "Current"),
+    LUCK: ("Characteristics", "Luck"),
+}
+
+
+def replace_file(tmp_path: str, fpath: str):
+    """ Atomically moves tmp_path over fpath """
+    try:
+        os.replace(tmp_path, fpath)
+    except AttributeError:  # MicroPython, where rename replaces
+        os.rename(tmp_path, fpath)
+
+
+class SheetJournal:
+    # journal size in bytes at which compaction is due
+    compact_after = 512
+
+    def __init__(self, sheet_path: str):
+        """ :param: the sheet this journal belongs to, the journal sits beside it """
+        stem = sheet_path.rsplit(".", 1)[0] if "." in sheet_path.rsplit("/", 1)[-1] else sheet_path
+        self.fpath = stem + ".journal"
+        try:
+            self.size = os.stat(self.fpath)[6]
+        except OSError:
+            self.size = 0
+
+    @classmethod
+    def encode(cls, kind: int, delta: int, value: int, name: str = "") -> bytes:
+        name = name.encode()
+        if len(name) > 255:
+            raise ValueError("journal names are limited to 255 bytes")
+        if not (-0x8000 <= delta <= 0x7FFF and -0x8000 <= value <= 0x7FFF):
+            raise ValueError("journal values must fit in 16 bits")
+        return struct.pack(_RECORD, kind, len(name), delta, value) + name
+
+    def append(self, kind: int, delta: int, value: int, name: str = "") -> int:
+        return self.append_records([self.encode(kind, delta, value, name)])
+
+    def append_records(self, records: list[bytes]) -> int:
+        """ Appends encoded records in one write, returns bytes written """
+        data = b"".join(records)
+        with open(self.fpath, "ab") as file:
+            file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def records(self):
+        """
+        (kind, delta, value, name) for every record, oldest first.
+
+        A record cut short by power loss ends the journal.
+        """
+        try:
+            file = open(self.fpath, "rb")
+        except OSError:
+            return
+        with file:
+            while True:
+                head = file.read(_RECORD_SIZE)
+                if len(head) < _RECORD_SIZE:
+                    return
+                kind, name_len, delta, value = struct.unpack(_RECORD, head)
+                name = file.read(name_len)
+                if len(name) < name_len:
+                    return
+                yield kind, delta, value, name.decode()
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.size >= self.compact_after
+
+    def rewrite(self, records: list[bytes]) -> int:
+        """ Atomically replaces the journal with encoded records, returns bytes written """
+        data = b"".join(records)
+        tmp_path = self.fpath + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        replace_file(tmp_path, self.fpath)
+        self.size = len(data)
+        return len(data)
+
+
+class WriteBehind:
+    """
+    Holds back journal writes so a burst of changes becomes one write.
+
+    Tracked characters mark changed fields dirty instead of writing
+    them, and repeated changes to a field are folded into one record.
+    poll(), run while the keypad is idle, flushes once changes have
+    been quiet for idle_ms, or max_delay_ms after the first unwritten
+    change if they keep coming. Call flush() when leaving a menu or
+    powering off. Journals past their size limit are compacted after
+    a flush, unless the caller asks to leave that for a later one.
+    """
+
+    idle_ms = 2000
+    max_delay_ms = 10_000
+
+    def __init__(self):
+        self.characters = []
+        self.changes = 0
+        self.flushes = 0
+        self.compactions = 0
+        self.bytes_written = 0
+        self._first_change = None
+        self._last_change = None
+
+    def track(self, character):
+        """ :param: a CthulhuCharacter with a journal """
+        if character not in self.characters:
+            self.characters.append(character)
+        character.write_behind = self
+
+    def untrack(self, character):
+        """ Flushes the character's changes and stops holding them back """
+        if character in self.characters:
+            if self._flush_character(character):
+                self.flushes += 1
+            self.characters.remove(character)
+        character.write_behind = None
+
+    def touch(self):
+        """ Called by a character when it marks a field dirty """
+        now = ticks_ms()
+        self.changes += 1
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+
+    def poll(self, compact: bool = True):
+        """ :param: False to only append to journals, compacting them is left for a later flush """
+        if self._first_change is None:
+            return
+        now = ticks_ms()
+        if (ticks_diff(now, self._last_change) >= self.idle_ms
+                or ticks_diff(now, self._first_change) >= self.max_delay_ms):
+            self.flush(compact)
+
+    def flush(self, compact: bool = True):
+        """ :param: False to only append to journals, compacting them is left for a later flush """
+        written = False
+        for character in self.characters:
+            written = self._flush_character(character, compact) or written
+        if written:
+            self.flushes += 1
+        self._first_change = self._last_change = None
+
+    def _flush_character(self, character, compact: bool = True) -> bool:
+        written = character.dirty
+        if written:
+            self.bytes_written += character.flush()
+        # also catches up on a compaction an earlier flush left
+        if compact and character.journal.needs_compaction:
+            self.bytes_written += character.compact()
+            self.compactions += 1
+        return written
+
+    def stats(self) -> dict:
+        """ For tuning idle_ms and max_delay_ms """
+        return {
+            "changes": self.changes,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "bytes_written": self.bytes_written,
+        }
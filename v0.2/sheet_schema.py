@@ -0,0 +1,188 @@
+"""
+Schemas for Call of Cthulhu and Pulp Cthulhu character sheets.
+
+A schema is compiled once into a flat list of checks, grouped by top
+level section, so a sheet is checked in one pass and every problem is
+reported together instead of surfacing later as a KeyError mid roll.
+Lazily loaded sheets are checked a section at a time as they load.
+"""
+
+__author__ = "Nathan Winslow"
+__copyright__ = "MIT"
+
+from dice import DiceExpression
+from json_parser import SECTION_TYPES
+
+
+class SchemaError(ValueError):
+    """ Raised with every problem found in a sheet """
+
+    def __init__(self, problems: list[str]):
+        super().__init__(f"{len(problems)} problem(s) in the sheet")
+        self.problems = problems
+
+    def __str__(self):
+        return "; ".join(self.problems)
+
+
+def _damage(weapon) -> str:
+    """ Weapons need a name and a damage string that rolls, empty slots are fine """
+    if not isinstance(weapon, SECTION_TYPES):
+        return "should be a section"
+    if not isinstance(weapon.get("Name"), str):
+        return "needs a Name"
+    # the sheets store the damage under "Damage " (trailing space)
+    damage = weapon.get("Damage ", weapon.get("Damage"))
+    if not isinstance(damage, str):
+        return "needs a Damage string"
+    if damage:
+        try:
+            DiceExpression.compile(damage)
+        except ValueError as e:
+            return f"damage '{damage}': {e}"
+    return None
+
+
+_NONE = type(None)
+
+# (path, types or validator, low, high)
+# "*" in a path matches every key at that level, "**" every value below it.
+# A validator takes the value and returns a problem or None.
+CTHULHU_FIELDS = (
+    (("Name",), str),
+    (("Pronoun",), str),
+    (("Age",), int, 0, None),
+    (("Characteristics", "STR"), int, 0, None),
+    (("Characteristics", "CON"), int, 0, None),
+    (("Characteristics", "DEX"), int, 0, None),
+    (("Characteristics", "INT"), int, 0, None),
+    (("Characteristics", "SIZ"), int, 0, None),
+    (("Characteristics", "POW"), int, 0, None),
+    (("Characteristics", "APP"), int, 0, None),
+    (("Characteristics", "EDU"), int, 0, None),
+    (("Characteristics", "Luck"), int, 0, None),
+    (("Characteristics", "Hit Points", "Maximum"), int, 0, None),
+    (("Characteristics", "Hit Points", "Current"), int),
+    (("Characteristics", "Magic Points", "Maximum"), int, 0, None),
+    (("Characteristics", "Magic Points", "Current"), int),
+    (("Characteristics", "Sanity", "Current"), int),
+    (("Characteristics", "Sanity", "Maximum"), int, 0, 99),
+    (("Skills", "**"), int, 0, None),
+    (("Combat", "Weapons", "*"), _damage),
+    (("Combat", "Weapons", "*", "Ammo"), (int, _NONE)),
+)
+
+PULP_FIELDS = CTHULHU_FIELDS + (
+    (("Archetype",), str),
+    (("Pulp Talents", "*"), str),
+)
+
+
+def _type_names(types: tuple) -> str:
+    return " or ".join("null" if t is _NONE else t.__name__ for t in types)
+
+
+def _compile_field(path: tuple, spec, low=None, high=None):
+    """ One check, a closure taking (value, problems) for the value at a concrete path """
+    if isinstance(spec, (type, tuple)):
+        types = spec if isinstance(spec, tuple) else (spec,)
+        allow_bool = bool in types
+        expected = _type_names(types)
+
+        def check(where: str, value, problems: list):
+            if not isinstance(value, types) or (isinstance(value, bool) and not allow_bool):
+                problems.append(f"{where} should be {expected}, not {type(value).__name__}")
+            elif low is not None and value < low:
+                problems.append(f"{where} is {value}, below {low}")
+            elif high is not None and value > high:
+                problems.append(f"{where} is {value}, above {high}")
+    else:
+        def check(where: str, value, problems: list):
+            problem = spec(value)
+            if problem is not None:
+                problems.append(f"{where} {problem}")
+
+    def run(value, problems: list):
+        _walk(value, path, 1, path[:1], problems, check)
+
+    return run
+
+
+def _walk(value, path: tuple, i: int, prefix: tuple, problems: list, check):
+    while i < len(path):
+        key = path[i]
+        if not isinstance(value, SECTION_TYPES):
+            problems.append(f"{'.'.join(prefix)} should be a section")
+            return
+        if key == "*" or key == "**":
+            for k, v in value.items():
+                deeper = key == "**" and isinstance(v, SECTION_TYPES)
+                _walk(v, path, i if deeper else i + 1, prefix + (k,), problems, check)
+            return
+        if key not in value:
+            problems.append(f"{'.'.join(prefix + (key,))} is missing")
+            return
+        value = value[key]
+        prefix = prefix + (key,)
+        i += 1
+    check(".".join(prefix), value, problems)
+
+
+class SheetSchema:
+    def __init__(self, fields: tuple):
+        # top level section -> flat list of compiled checks
+        self.checks = {}
+        for field in fields:
+            path = field[0]
+            self.checks.setdefault(path[0], []).append(_compile_field(*field))
+
+    def problems(self, sheet) -> list[str]:
+        """ Every problem with the whole sheet """
+        problems = []
+        for section, checks in self.checks.items():
+            if section not in sheet:
+                problems.append(f"{section} is missing")
+                continue
+            value = sheet[section]
+            for check in checks:
+                check(value, problems)
+        return problems
+
+    def section_problems(self, section: str, value) -> list[str]:
+        """ Problems with one top level section """
+        problems = []
+        for check in self.checks.get(section, ()):
+            check(value, problems)
+        return problems
+
+    def validate(self, sheet):
+        """ :raises: SchemaError listing every problem """
+        problems = self.problems(sheet)
+        if problems:
+            raise SchemaError(problems)
+
+    def validate_section(self, section: str, value):
+        """ :raises: SchemaError listing every problem in the section """
+        problems = self.section_problems(section, value)
+        if problems:
+            raise SchemaError(problems)
+
+    def watch(self, sheet):
+        """
+        Checks a LazySheet has every section now, and each section as it loads.
+
+        :raises: SchemaError listing the missing sections
+        """
+        problems = [f"{section} is missing" for section in self.checks if section not in sheet]
+        if problems:
+            raise SchemaError(problems)
+        sheet.on_load = self.validate_section
+
+
+CTHULHU_SCHEMA = SheetSchema(CTHULHU_FIELDS)
+PULP_SCHEMA = SheetSchema(PULP_FIELDS)
+
+
+def schema_for(sheet) -> SheetSchema:
+    """ The Pulp schema for sheets with Pulp Talents, Call of Cthulhu otherwise """
+    return PULP_SCHEMA if "Pulp Talents" in sheet else CTHULHU_SCHEMA
@@ -23,39 +23,122 @@ from web_api.response_builder import ResponseBuilder
 from web_api.wifi_connection import WiFiConnection
 
 # Import Characters as needed
-from character_sheet import PulpCharacter
+import json
+from json_parser import PathSelector
+from roster import Roster
+from sheet_schema import SchemaError, schema_for
+from dice import Dice
+from roll_audit import RollAuditor
 
-if not WiFiConnection.start_station_mode(True):
-    raise RuntimeError('network connection failed')
+roster = None  # set by serve(), shared with the game on the device
+
+if Dice.auditor is None:
+    Dice.auditor = RollAuditor()
+
+# largest request body accepted, a sheet is about 3 KB
+MAX_BODY = 16 * 1024
+
+
+async def read_request(reader) -> bytes:
+    """ The request line, headers and as much body as Content-Length says """
+    raw_request = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        raw_request += line
+        if line in (b"\r\n", b"\n", b""):
+            break
+        header = line.split(b":", 1)
+        if len(header) == 2 and header[0].strip().lower() == b"content-length":
+            length = int(header[1].decode().strip())
+    if not 0 <= length <= MAX_BODY:
+        raise ValueError(f"request body of {length} bytes")
+    if length:
+        raw_request += await reader.readexactly(length)
+    return raw_request
 
-file_path = 'pulp_cthulhu_sheet.json'
-Randolph = PulpCharacter(file_path)
 
 async def handle_request(reader, writer):
     #TODO: Flesh method out as needed. 
     try:
-        raw_request = await reader.read(2048)
-
-        request = RequestParser(raw_request)
+        try:
+            request = RequestParser(await read_request(reader))
+        except ValueError:  # a body that isn't the JSON it says it is, or a bad Content-Length
+            request = None
 
         responder = ResponseBuilder()
 
-        if request.url_match("/api"):
+        if request is None:
+            responder.set_status(400)
+
+        elif request.url_match("/api"):
             action = request.get_action()
 
             if action == 'load_character':  # User wants to load a character to the browser
                 print(request.data())  # for debugging
                 
-                # ajax request for data
-                responder.set_body_from_dict(Randolph())
+                # ajax request for data, the first character unless an id is given
+                data = request.data() or {}
+                character_id = data.get('id') or (roster.ids() or [None])[0]
+                if character_id in roster.index:
+                    responder.set_body_from_dict(roster.load(character_id)())
+                else:
+                    responder.set_status(404)
+
+            elif action == 'list_characters':  # roster summaries, no sheets are parsed
+                responder.set_body_from_dict(roster.index)
+
+            elif action == 'select':  # values at a path selector, e.g. Skills.**
+                data = request.data() or {}
+                character_id = data.get('id') or (roster.ids() or [None])[0]
+                try:
+                    character = roster.load(character_id)
+                    matches = PathSelector.select_items(character.character_sheet, data.get('path', ''))
+                    responder.set_body_from_dict({'.'.join(path): value for path, value in matches})
+                except (KeyError, ValueError):  # unknown id or bad selector
+                    responder.set_status(400)
                 
             elif action == 'download_character':  # User wants to download character to device
-                status = 'OK'
-                response = {
-                    'status': status,
-                    'state': True,
-                }
-                responder.set_body_from_dict(response)
+                # checked before anything is written, so a bad sheet never reaches the roster
+                data = request.data() or {}
+                sheet = data.get('sheet')
+                try:
+                    if isinstance(sheet, str):
+                        sheet = json.loads(sheet)
+                    if not isinstance(sheet, dict):
+                        raise SchemaError(['sheet should be a JSON object'])
+                    schema_for(sheet).validate(sheet)
+                except ValueError as e:  # SchemaError or bad JSON
+                    responder.set_status(400)
+                    responder.set_body_from_dict({
+                        'status': 'invalid',
+                        'problems': getattr(e, 'problems', [str(e)]),
+                    })
+                else:
+                    character_id = ''.join(
+                        c if c.isalpha() or c.isdigit() else '_' for c in str(data.get('id') or sheet['Name'])
+                    )
+                    if character_id in roster.index and not data.get('overwrite'):
+                        # the browser asks first, then sends the sheet again with overwrite set
+                        responder.set_status(409)
+                        responder.set_body_from_dict({'status': 'exists', 'id': character_id})
+                    elif roster.reserved(character_id):
+                        responder.set_status(400)
+                        responder.set_body_from_dict({
+                            'status': 'invalid',
+                            'problems': [f"'{character_id}' is a reserved name"],
+                        })
+                    else:
+                        roster.import_sheet(character_id, sheet)
+                        response = {
+                            'status': 'OK',
+                            'state': True,
+                            'id': character_id,
+                        }
+                        responder.set_body_from_dict(response)
+
+            elif action == 'roll_audit':  # Is the box rigged? chi-square per die type
+                responder.set_body_from_dict(Dice.auditor.report())
 
             elif action == 'download_game':  # User wants to download game to device
                 status = 'OK'
@@ -78,8 +161,8 @@ async def handle_request(reader, writer):
         await writer.wait_closed()
                 
 
-    except OSError as e:
-        print(f"Connection error {e.errno}: {e}")
+    except (OSError, EOFError) as e:  # EOFError when the client hangs up mid body
+        print(f"Connection error: {e}")
 
 
 async def blink_led():
@@ -90,11 +173,23 @@ async def blink_led():
 
 
 
-async def main():
+async def serve(characters: Roster, host="0.0.0.0", port=80):
+    """
+    Joins the WiFi and starts answering requests on the running event loop
+
+    :param: the roster to serve, the same one the game loads from
+    """
+    global roster
+    roster = characters
+    if not WiFiConnection.start_station_mode(True):
+        raise RuntimeError('network connection failed')
+
     print("Setting up web server...\n")
+    return await asyncio.start_server(handle_request, host, port)
+
 
-    server = asyncio.start_server(handle_request, "0.0.0.0", 80)
-    asyncio.create_task(server)
+async def main():
+    await serve(Roster())
 
     asyncio.create_task(blink_led())
 
@@ -105,8 +200,9 @@ async def main():
         await asyncio.sleep(0)
 
 
-try:
-    asyncio.run(main())
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
 
-finally:
-    asyncio.new_event_loop()    
+    finally:
+        asyncio.new_event_loop()    
@@ -95,8 +95,8 @@ class RequestParser:
 
             if len(self.query_string) > 0:
                 self.query_params = self.decode_query_string(self.query_string)
-            else:
-                self.method = "ERROR"
+        else:
+            self.method = "ERROR"
             
     def parse_header_line(self, header_line):
         line_parts = header_line.split(':')
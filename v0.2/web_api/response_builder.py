@@ -15,6 +15,7 @@ class ResponseBuilder:
         400 : "Bad Request",
         403 : "Forbidden",
         404 : "Not Found", 
+        409 : "Conflict",
     }
 
     def __init__(self):